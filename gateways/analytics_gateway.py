@@ -0,0 +1,176 @@
+from gateways.base_gateway import BaseGateway
+import os
+import time
+import hashlib
+import zlib
+from decimal import Decimal
+from boto3.dynamodb.types import TypeDeserializer
+
+# Actions per transaction: one marker Put plus counter updates
+MAX_COUNTER_UPDATES = 99
+
+# How long applied-batch markers are kept (the table's TTL attribute is expires_at)
+BATCH_MARKER_TTL_SECONDS = int(os.environ.get('ANALYTICS_MARKER_TTL_SECONDS', str(7 * 24 * 3600)))
+
+# Metric items; every counter is a top-level number attribute updated with ADD
+ORDERS_BY_STATUS_KEY = 'orders#status'
+UNITS_SHARD_PREFIX = 'units#product#'
+REVENUE_TOTAL_KEY = 'revenue#all'
+REVENUE_DAY_PREFIX = 'revenue#day#'
+
+# Units sold are spread over a fixed set of items (one counter per product ID,
+# by a stable hash) so no item nears the 400 KB limit; changing the count
+# re-buckets products, so it must stay fixed once counters exist
+UNITS_SHARDS = int(os.environ.get('ANALYTICS_UNITS_SHARDS', '16'))
+
+# Orders in these statuses don't count towards revenue or units sold
+EXCLUDED_REVENUE_STATUSES = ('cancelled',)
+
+_deserializer = TypeDeserializer()
+
+def order_contributions(order):
+    """What one order adds to each counter, as {metric_key: {counter: Decimal}}"""
+    if not order:
+        return {}
+
+    contributions = {ORDERS_BY_STATUS_KEY: {order.get('status', 'pending'): Decimal(1)}}
+    if order.get('status') in EXCLUDED_REVENUE_STATUSES:
+        return contributions
+
+    revenue = {
+        'order_count': Decimal(1),
+        'total_amount': Decimal(str(order.get('total_amount', 0))),
+        'tax_amount': Decimal(str(order.get('tax_amount', 0))),
+        'customization_amount': Decimal(str(order.get('customization_amount', 0)))
+    }
+    contributions[REVENUE_TOTAL_KEY] = dict(revenue)
+    if order.get('created_at'):
+        contributions[REVENUE_DAY_PREFIX + order['created_at'][:10]] = dict(revenue)
+
+    for item in order.get('items', []):
+        if item.get('product_id'):
+            units = contributions.setdefault(units_shard_key(item['product_id']), {})
+            units[item['product_id']] = units.get(item['product_id'], 0) + Decimal(str(item.get('quantity', 0)))
+    return contributions
+
+def units_shard_key(product_id):
+    """Metric key of the units item holding a product's counter"""
+    return f"{UNITS_SHARD_PREFIX}{zlib.crc32(product_id.encode('utf-8')) % UNITS_SHARDS}"
+
+def stream_deltas(records):
+    """Counter changes for a batch of orders-table stream records.
+
+    Each record contributes contributions(new image) - contributions(old
+    image), so inserts add, deletes subtract and updates (e.g. a status
+    change) move amounts between counters. Zero deltas are dropped.
+    """
+    deltas = {}
+    for record in records:
+        images = record.get('dynamodb', {})
+        new_order = _deserialize(images.get('NewImage'))
+        old_order = _deserialize(images.get('OldImage'))
+        for sign, order in ((1, new_order), (-1, old_order)):
+            for metric_key, counters in order_contributions(order).items():
+                metric = deltas.setdefault(metric_key, {})
+                for counter, value in counters.items():
+                    metric[counter] = metric.get(counter, 0) + sign * value
+
+    return {
+        metric_key: {counter: value for counter, value in counters.items() if value != 0}
+        for metric_key, counters in sorted(deltas.items())
+        if any(value != 0 for value in counters.values())
+    }
+
+def _deserialize(image):
+    """Turn a stream image (DynamoDB JSON) into a plain item"""
+    if not image:
+        return None
+    return {name: _deserializer.deserialize(value) for name, value in image.items()}
+
+class AnalyticsGateway(BaseGateway):
+    """Pre-aggregated order counters maintained from the orders table stream"""
+    def __init__(self):
+        super().__init__(os.environ['ANALYTICS_TABLE_NAME'], id_field='metric_key')
+
+    def apply_stream_batch(self, records, batch_id=None):
+        """Apply the counter deltas of a batch of stream records exactly once.
+
+        Each transaction also writes a marker for its part of the batch, so a
+        retried batch skips the parts that were already applied. Returns the
+        number of metric items changed.
+        """
+        deltas = stream_deltas(records)
+        if not deltas:
+            return 0
+
+        batch_id = batch_id or _batch_id(records)
+        metric_keys = list(deltas)
+        transaction_canceled = self.dynamodb.meta.client.exceptions.TransactionCanceledException
+        applied = 0
+        for start in range(0, len(metric_keys), MAX_COUNTER_UPDATES):
+            chunk = metric_keys[start:start + MAX_COUNTER_UPDATES]
+            transact_items = [{'Put': {
+                'TableName': self.table.name,
+                'Item': {
+                    self.id_field: f"batch#{batch_id}#{start // MAX_COUNTER_UPDATES}",
+                    'expires_at': int(time.time()) + BATCH_MARKER_TTL_SECONDS
+                },
+                'ConditionExpression': 'attribute_not_exists(metric_key)'
+            }}]
+            transact_items.extend(self._counter_update(metric_key, deltas[metric_key]) for metric_key in chunk)
+
+            try:
+                self.transact_write(transact_items)
+                applied += len(chunk)
+            except transaction_canceled as e:
+                if self.cancellation_reasons(e)[0] != 'ConditionalCheckFailed':
+                    raise
+                print(f"Skipping analytics batch {batch_id} part {start // MAX_COUNTER_UPDATES}, already applied")
+        return applied
+
+    def _counter_update(self, metric_key, counters):
+        """Transaction action adding deltas to the counters of one metric item"""
+        names = {}
+        values = {}
+        clauses = []
+        for index, (counter, value) in enumerate(counters.items()):
+            names[f"#c{index}"] = counter
+            values[f":v{index}"] = value
+            clauses.append(f"#c{index} :v{index}")
+        return {'Update': {
+            'TableName': self.table.name,
+            'Key': {self.id_field: metric_key},
+            'UpdateExpression': 'ADD ' + ', '.join(clauses),
+            'ExpressionAttributeNames': names,
+            'ExpressionAttributeValues': values
+        }}
+
+    def get_dashboard(self, days):
+        """Counters for the dashboard: totals, orders per status, units per product
+        and revenue for each of the given days (YYYY-MM-DD strings)"""
+        day_keys = [REVENUE_DAY_PREFIX + day for day in days]
+        units_keys = [f"{UNITS_SHARD_PREFIX}{shard}" for shard in range(UNITS_SHARDS)]
+        items = self.batch_get_by_ids([REVENUE_TOTAL_KEY, ORDERS_BY_STATUS_KEY] + units_keys + day_keys)
+
+        def counters(metric_key):
+            item = dict(items.get(metric_key) or {})
+            item.pop(self.id_field, None)
+            return item
+
+        return {
+            'revenue_total': counters(REVENUE_TOTAL_KEY),
+            'orders_by_status': counters(ORDERS_BY_STATUS_KEY),
+            'units_by_product': {
+                product_id: units for metric_key in units_keys for product_id, units in counters(metric_key).items()
+            },
+            'revenue_by_day': [dict(counters(REVENUE_DAY_PREFIX + day), day=day) for day in days]
+        }
+
+def _batch_id(records):
+    """Stable ID of a stream batch, from the IDs of its records (a retried batch
+    holds the same records)"""
+    digest = hashlib.sha256()
+    for record in records:
+        digest.update(record.get('eventID', '').encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
@@ -0,0 +1,49 @@
+import os
+import threading
+import boto3
+from botocore.config import Config
+
+# One tuned config for every AWS client in the container: a connection pool
+# large enough for parallel scans and pipeline stages, TCP keep-alive so warm
+# invocations reuse sockets, and bounded timeouts/retries
+CLIENT_CONFIG = Config(
+    max_pool_connections=int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', '32')),
+    tcp_keepalive=True,
+    connect_timeout=float(os.environ.get('AWS_CONNECT_TIMEOUT', '2')),
+    read_timeout=float(os.environ.get('AWS_READ_TIMEOUT', '10')),
+    retries={'max_attempts': int(os.environ.get('AWS_MAX_ATTEMPTS', '3')), 'mode': 'standard'}
+)
+
+_session = None
+_clients = {}
+_resources = {}
+_lock = threading.Lock()
+
+def _get_session():
+    """Process-wide boto3 session (must be called with the lock held)"""
+    global _session
+    if _session is None:
+        _session = boto3.session.Session()
+    return _session
+
+def get_client(service_name):
+    """Get the shared low-level client for a service, creating it on first use"""
+    client = _clients.get(service_name)
+    if client is None:
+        with _lock:
+            client = _clients.get(service_name)
+            if client is None:
+                client = _get_session().client(service_name, config=CLIENT_CONFIG)
+                _clients[service_name] = client
+    return client
+
+def get_resource(service_name):
+    """Get the shared resource for a service, creating it on first use"""
+    resource = _resources.get(service_name)
+    if resource is None:
+        with _lock:
+            resource = _resources.get(service_name)
+            if resource is None:
+                resource = _get_session().resource(service_name, config=CLIENT_CONFIG)
+                _resources[service_name] = resource
+    return resource
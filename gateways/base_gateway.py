@@ -1,8 +1,43 @@
 import os
-import boto3
+from boto3.dynamodb.conditions import Attr
+from boto3.dynamodb.types import TypeSerializer
 from decimal import Decimal
 import json
 import uuid
+import base64
+import binascii
+import queue
+import random
+import threading
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from gateways.aws_clients import get_resource
+
+# Upper bound on threads used for a parallel (segmented) scan
+MAX_SCAN_WORKERS = int(os.environ.get('MAX_SCAN_WORKERS', '8'))
+
+# DynamoDB limit on keys per BatchGetItem call
+BATCH_GET_LIMIT = 100
+
+# DynamoDB limit on put requests per BatchWriteItem call, and the threads writing chunks
+BATCH_WRITE_LIMIT = 25
+MAX_BATCH_WRITE_WORKERS = int(os.environ.get('MAX_BATCH_WRITE_WORKERS', '4'))
+
+# Retry policy for unprocessed batch items (exponential backoff with full jitter)
+MAX_BATCH_RETRIES = 8
+BATCH_BACKOFF_BASE = 0.05
+BATCH_BACKOFF_CAP = 2.0
+
+# Checks that items only hold types DynamoDB can store
+_serializer = TypeSerializer()
+
+# Guards the lazy creation of Table handles from the shared resource
+_table_lock = threading.Lock()
+
+# Items evaluated per Scan request of a filtered page, and requests per page
+SCAN_PAGE_EVALUATE_LIMIT = int(os.environ.get('SCAN_PAGE_EVALUATE_LIMIT', '500'))
+SCAN_PAGE_MAX_REQUESTS = int(os.environ.get('SCAN_PAGE_MAX_REQUESTS', '20'))
 
 # Custom JSON encoder for handling Decimal values
 class DecimalEncoder(json.JSONEncoder):
@@ -11,11 +46,37 @@ class DecimalEncoder(json.JSONEncoder):
             return float(obj)
         return super(DecimalEncoder, self).default(obj)
 
+def content_etag(serialized_body):
+    """Strong HTTP entity tag for a serialized response body"""
+    return '"' + hashlib.sha256(serialized_body.encode('utf-8')).hexdigest()[:32] + '"'
+
 class BaseGateway:
-    def __init__(self, table_name, id_field='id'):
-        self.dynamodb = boto3.resource('dynamodb')
-        self.table = self.dynamodb.Table(table_name)
+    def __init__(self, table_name, id_field='id', scan_segments=1):
+        self.table_name = table_name
         self.id_field = id_field
+        self.scan_segments = max(1, int(scan_segments))
+        self._table = None
+    
+    @property
+    def dynamodb(self):
+        """Shared DynamoDB resource, created on first use"""
+        return get_resource('dynamodb')
+    
+    @property
+    def table(self):
+        """Table handle, created on first use so module-level gateways import fast"""
+        if self._table is None:
+            with _table_lock:
+                if self._table is None:
+                    self._table = self.dynamodb.Table(self.table_name)
+        return self._table
+    
+    @property
+    def client(self):
+        """The resource's low-level client. Unlike the resource and Table objects
+        it is thread-safe, and it still converts Python values, so calls made
+        from worker threads (pipeline stages, parallel scans) go through it"""
+        return self.table.meta.client
     
     def create(self, item):
         """Create a new item"""
@@ -27,20 +88,209 @@ class BaseGateway:
         self.table.put_item(Item=item)
         return item
     
-    def get_all(self):
-        """Get all items from the table"""
-        response = self.table.scan()
-        return response.get('Items', [])
+    def get_all(self, total_segments=None):
+        """Get all items from the table, following pagination across all segments"""
+        items = []
+        for page in self.iter_pages(total_segments=total_segments):
+            items.extend(page)
+        return items
+    
+    def iter_all(self, total_segments=None, **scan_kwargs):
+        """Stream all items from the table one at a time"""
+        for page in self.iter_pages(total_segments=total_segments, **scan_kwargs):
+            for item in page:
+                yield item
+    
+    def iter_pages(self, total_segments=None, **scan_kwargs):
+        """Stream scan pages (lists of items), optionally fanning out over parallel segments"""
+        total_segments = max(1, int(total_segments or self.scan_segments))
+        if total_segments == 1:
+            for page in self._scan_segment(scan_kwargs):
+                yield page
+            return
+        
+        # Pages from every segment are funnelled through a bounded queue so the
+        # caller holds at most a few pages in memory at any time
+        pages = queue.Queue(maxsize=total_segments * 2)
+        stop = threading.Event()
+        finished = object()
+        
+        def put(entry):
+            while not stop.is_set():
+                try:
+                    pages.put(entry, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        def worker(segment):
+            try:
+                for page in self._scan_segment(scan_kwargs, segment, total_segments):
+                    if not put(page):
+                        return
+            except Exception as e:
+                put(e)
+            finally:
+                put(finished)
+        
+        executor = ThreadPoolExecutor(max_workers=min(total_segments, MAX_SCAN_WORKERS))
+        try:
+            for segment in range(total_segments):
+                executor.submit(worker, segment)
+            
+            remaining = total_segments
+            while remaining:
+                entry = pages.get()
+                if entry is finished:
+                    remaining -= 1
+                elif isinstance(entry, Exception):
+                    raise entry
+                else:
+                    yield entry
+        finally:
+            # Unblock any workers still waiting to hand over a page
+            stop.set()
+            executor.shutdown(wait=True)
+    
+    def _scan_segment(self, scan_kwargs, segment=None, total_segments=None):
+        """Yield every page of a single scan segment, following LastEvaluatedKey"""
+        params = dict(scan_kwargs)
+        if segment is not None:
+            params['Segment'] = segment
+            params['TotalSegments'] = total_segments
+        
+        while True:
+            response = self.client.scan(TableName=self.table.name, **params)
+            yield response.get('Items', [])
+            
+            last_key = response.get('LastEvaluatedKey')
+            if not last_key:
+                break
+            params['ExclusiveStartKey'] = last_key
     
     def get_by_id(self, item_id):
         """Get item by ID"""
-        response = self.table.get_item(
+        response = self.client.get_item(
+            TableName=self.table.name,
             Key={self.id_field: item_id}
         )
         return response.get('Item')
     
+    def batch_get_by_ids(self, item_ids):
+        """Get many items by ID with BatchGetItem, returning a dict keyed by ID"""
+        unique_ids = list(dict.fromkeys(item_ids))
+        found = {}
+        
+        for start in range(0, len(unique_ids), BATCH_GET_LIMIT):
+            chunk = unique_ids[start:start + BATCH_GET_LIMIT]
+            request_items = {self.table.name: {'Keys': [{self.id_field: item_id} for item_id in chunk]}}
+            
+            attempt = 0
+            while request_items:
+                response = self.client.batch_get_item(RequestItems=request_items)
+                for item in response.get('Responses', {}).get(self.table.name, []):
+                    found[item[self.id_field]] = item
+                
+                # Retry throttled keys with backoff
+                request_items = response.get('UnprocessedKeys')
+                if request_items:
+                    attempt += 1
+                    if attempt > MAX_BATCH_RETRIES:
+                        raise RuntimeError(f"Batch get on {self.table.name} still throttled after {MAX_BATCH_RETRIES} retries")
+                    self._backoff(attempt)
+        
+        return found
+    
+    def batch_create(self, items):
+        """Create many items with BatchWriteItem and return one result per item, in order.
+        
+        Items are written in chunks of 25 on a few threads; throttled puts
+        (UnprocessedItems) are retried with backoff. Each result is a dict with
+        the item's index, ID and status ('created' or 'failed', with an error).
+        """
+        results = [None] * len(items)
+        pending = []
+        seen_ids = set()
+        for index, item in enumerate(items):
+            if self.id_field not in item:
+                item[self.id_field] = str(uuid.uuid4())
+            item_id = item[self.id_field]
+            # Rows DynamoDB can't store (e.g. floats) fail on their own instead of sinking their chunk
+            try:
+                _serializer.serialize(item)
+            except (TypeError, ValueError) as e:
+                results[index] = {'index': index, self.id_field: item_id, 'status': 'failed', 'error': str(e)}
+                continue
+            # A batch can't hold the same key twice, so only the first one is written
+            if item_id in seen_ids:
+                results[index] = {'index': index, self.id_field: item_id, 'status': 'failed',
+                                  'error': f"Duplicate {self.id_field} in import"}
+                continue
+            seen_ids.add(item_id)
+            pending.append(index)
+        
+        chunks = [pending[start:start + BATCH_WRITE_LIMIT] for start in range(0, len(pending), BATCH_WRITE_LIMIT)]
+        workers = max(1, min(MAX_BATCH_WRITE_WORKERS, len(chunks)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for chunk_results in executor.map(lambda chunk: self._batch_write_chunk(items, chunk), chunks):
+                for result in chunk_results:
+                    results[result['index']] = result
+        return results
+    
+    def _batch_write_chunk(self, items, indexes):
+        """Write up to 25 items, retrying unprocessed puts, and return their results"""
+        by_id = {items[index][self.id_field]: index for index in indexes}
+        request_items = {self.table.name: [{'PutRequest': {'Item': items[index]}} for index in indexes]}
+        error = None
+        
+        attempt = 0
+        try:
+            while request_items:
+                response = self.client.batch_write_item(RequestItems=request_items)
+                request_items = response.get('UnprocessedItems')
+                if request_items:
+                    attempt += 1
+                    if attempt > MAX_BATCH_RETRIES:
+                        error = f"Still throttled after {MAX_BATCH_RETRIES} retries"
+                        break
+                    self._backoff(attempt)
+        except Exception as e:
+            # e.g. an item over the size limit fails its whole chunk, so retry the
+            # rows one by one (puts are idempotent) to fail only the bad ones
+            if len(indexes) > 1:
+                return [result for index in indexes for result in self._batch_write_chunk(items, [index])]
+            request_items = {self.table.name: [{'PutRequest': {'Item': items[index]}} for index in indexes]}
+            error = str(e)
+        
+        failed = {request['PutRequest']['Item'][self.id_field] for request in (request_items or {}).get(self.table.name, [])}
+        results = []
+        for item_id, index in by_id.items():
+            if item_id in failed:
+                results.append({'index': index, self.id_field: item_id, 'status': 'failed', 'error': error})
+            else:
+                results.append({'index': index, self.id_field: item_id, 'status': 'created'})
+        return results
+    
+    def _backoff(self, attempt):
+        """Sleep for an exponentially growing, fully jittered interval"""
+        time.sleep(random.uniform(0, min(BATCH_BACKOFF_CAP, BATCH_BACKOFF_BASE * (2 ** attempt))))
+    
     def update(self, item_id, updates):
         """Update an item"""
+        update_params = self._build_update_params(updates)
+        if update_params:
+            response = self.table.update_item(
+                Key={self.id_field: item_id},
+                ReturnValues="ALL_NEW",
+                **update_params
+            )
+            return response.get('Attributes')
+        
+        return self.get_by_id(item_id)  # No updates to apply
+    
+    def _build_update_params(self, updates):
+        """Build SET expression parameters for an update, or None if there is nothing to set"""
         # Build update expression
         update_expression = "SET "
         expression_attribute_values = {}
@@ -50,23 +300,17 @@ class BaseGateway:
                 update_expression += f"#{key} = :{key}, "
                 expression_attribute_values[f":{key}"] = value
         
-        # Remove trailing comma and space
-        if update_expression != "SET ":
-            update_expression = update_expression[:-2]
-            
-            # Build expression attribute names
-            expression_attribute_names = {f"#{k}": k for k in updates.keys() if k != self.id_field}
-            
-            response = self.table.update_item(
-                Key={self.id_field: item_id},
-                UpdateExpression=update_expression,
-                ExpressionAttributeNames=expression_attribute_names,
-                ExpressionAttributeValues=expression_attribute_values,
-                ReturnValues="ALL_NEW"
-            )
-            return response.get('Attributes')
+        if update_expression == "SET ":
+            return None
         
-        return self.get_by_id(item_id)  # No updates to apply
+        # Build expression attribute names
+        expression_attribute_names = {f"#{k}": k for k in updates.keys() if k != self.id_field}
+        
+        return {
+            'UpdateExpression': update_expression[:-2],  # Remove trailing comma and space
+            'ExpressionAttributeNames': expression_attribute_names,
+            'ExpressionAttributeValues': expression_attribute_values
+        }
     
     def delete(self, item_id):
         """Delete an item"""
@@ -78,7 +322,87 @@ class BaseGateway:
     
     def query_by_attribute(self, attribute_name, attribute_value):
         """Query items by a specific attribute"""
-        response = self.table.scan(
-            FilterExpression=boto3.dynamodb.conditions.Attr(attribute_name).eq(attribute_value)
-        )
-        return response.get('Items', [])
\ No newline at end of file
+        return list(self.iter_all(
+            FilterExpression=Attr(attribute_name).eq(attribute_value)
+        ))
+    
+    def iter_query(self, **query_kwargs):
+        """Stream every item matching a key-based query, following pagination"""
+        params = dict(query_kwargs)
+        while True:
+            response = self.table.query(**params)
+            for item in response.get('Items', []):
+                yield item
+            
+            last_key = response.get('LastEvaluatedKey')
+            if not last_key:
+                break
+            params['ExclusiveStartKey'] = last_key
+    
+    def query_page(self, limit=None, cursor=None, **query_kwargs):
+        """Run one page of a key-based query and return (items, next_cursor)"""
+        params = dict(query_kwargs)
+        if limit:
+            params['Limit'] = limit
+        if cursor:
+            params['ExclusiveStartKey'] = self.decode_cursor(cursor)
+        
+        response = self.table.query(**params)
+        return response.get('Items', []), self.encode_cursor(response.get('LastEvaluatedKey'))
+    
+    def scan_page(self, limit, cursor=None, **scan_kwargs):
+        """Scan the table for one page of up to limit matching items and return (items, next_cursor).
+        
+        Each request evaluates SCAN_PAGE_EVALUATE_LIMIT items, so a sparse
+        FilterExpression still fills a page in a few calls; the cursor is
+        the key of the last item returned. After SCAN_PAGE_MAX_REQUESTS the
+        page is returned short, with a cursor to continue from.
+        """
+        params = dict(scan_kwargs, Limit=SCAN_PAGE_EVALUATE_LIMIT)
+        if cursor:
+            params['ExclusiveStartKey'] = self.decode_cursor(cursor)
+        
+        items = []
+        for _ in range(SCAN_PAGE_MAX_REQUESTS):
+            response = self.table.scan(**params)
+            last_key = response.get('LastEvaluatedKey')
+            matched = response.get('Items', [])
+            room = limit - len(items)
+            if len(matched) >= room:
+                items.extend(matched[:room])
+                if len(matched) == room and not last_key:
+                    return items, None
+                return items, self.encode_cursor({self.id_field: items[-1][self.id_field]})
+            
+            items.extend(matched)
+            if not last_key:
+                return items, None
+            params['ExclusiveStartKey'] = last_key
+        return items, self.encode_cursor(last_key)
+    
+    def encode_cursor(self, last_evaluated_key):
+        """Turn a LastEvaluatedKey into an opaque, URL-safe pagination cursor"""
+        if not last_evaluated_key:
+            return None
+        raw = json.dumps(last_evaluated_key, cls=DecimalEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('utf-8').rstrip('=')
+    
+    def decode_cursor(self, cursor):
+        """Turn a pagination cursor back into an ExclusiveStartKey"""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            key = json.loads(base64.urlsafe_b64decode(padded.encode('utf-8')), parse_float=Decimal)
+        except (ValueError, binascii.Error):
+            raise ValueError('Invalid cursor')
+        if not isinstance(key, dict):
+            raise ValueError('Invalid cursor')
+        return key
+    
+    def transact_write(self, transact_items):
+        """Run a list of TransactWriteItems actions atomically"""
+        return self.dynamodb.meta.client.transact_write_items(TransactItems=transact_items)
+    
+    def cancellation_reasons(self, error):
+        """Return the per-action cancellation codes of a cancelled transaction"""
+        reasons = error.response.get('CancellationReasons', [])
+        return [reason.get('Code', 'None') for reason in reasons]
\ No newline at end of file
@@ -0,0 +1,91 @@
+import os
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Every named cache in this container, for reporting hit/miss counters
+_registry = {}
+
+# Minimum seconds between two cache_stats log lines from one container
+STATS_LOG_INTERVAL = float(os.environ.get('CACHE_STATS_LOG_INTERVAL', '60'))
+_last_stats_log = time.time()
+
+class LRUCache:
+    """Size-bounded, thread-safe LRU cache with per-entry expiry.
+
+    Instances are meant to live at module level so they survive across
+    invocations in a warm Lambda container.
+    """
+    def __init__(self, name, max_size=1024, ttl=60):
+        self.name = name
+        self.max_size = max(1, int(max_size))
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        _registry[name] = self
+
+    def get(self, key, default=None):
+        """Get a live entry, or default if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None, expires_at=None):
+        """Store an entry, expiring after ttl seconds (or at expires_at, an epoch time)"""
+        if expires_at is None:
+            ttl = self.ttl if ttl is None else ttl
+            expires_at = time.time() + ttl if ttl else None
+
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *keys):
+        """Drop the given entries, or every entry if no keys are given"""
+        with self._lock:
+            if not keys:
+                self._entries.clear()
+                return
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        """Hit/miss counters for this cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+def cache_stats():
+    """Hit/miss counters for every cache in this container"""
+    return {name: cache.stats() for name, cache in _registry.items()}
+
+def log_cache_stats(force=False):
+    """Print a structured cache_stats log line, at most once per STATS_LOG_INTERVAL"""
+    global _last_stats_log
+    now = time.time()
+    if not force and now - _last_stats_log < STATS_LOG_INTERVAL:
+        return
+    _last_stats_log = now
+    print(json.dumps({'event': 'cache_stats', 'caches': cache_stats()}))
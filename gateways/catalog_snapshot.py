@@ -0,0 +1,157 @@
+import os
+import gzip
+import json
+import time
+from datetime import datetime
+from decimal import Decimal
+from botocore.exceptions import ClientError
+from gateways.aws_clients import get_client
+from gateways.base_gateway import content_etag
+from gateways.serializer import to_json, parse_timestamp
+
+# S3 prefix holding latest.json.gz, manifest.json and the versions/ copies (the
+# snapshot bucket in serverless.yml expires versions/ objects with a lifecycle rule)
+SNAPSHOT_PREFIX = os.environ.get('CATALOG_SNAPSHOT_PREFIX', 'catalog')
+
+# The latest snapshot and manifest change in place; versions never do
+LATEST_CACHE_CONTROL = 'public, max-age=60'
+MANIFEST_CACHE_CONTROL = 'no-cache'
+VERSION_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# A snapshot only counts as covering a local write if it was scanned this long after it
+CLOCK_SKEW_SECONDS = 1.0
+
+def catalog_entry(products, body=None):
+    """Catalog cache entry: the products with their serialized body, ETag and
+    last modification time"""
+    body = to_json(products) if body is None else body
+    # Values that aren't timestamps are ignored rather than breaking conditional requests
+    updated = [product['updated_at'] for product in products if parse_timestamp(product.get('updated_at'))]
+    return {
+        'products': products,
+        'body': body,
+        'etag': content_etag(body),
+        'last_modified': max(updated, key=parse_timestamp) if updated else None
+    }
+
+class CatalogSnapshot:
+    """Pre-serialized, gzip-compressed copy of the product catalog in S3.
+
+    Published by the products-stream function after writes; warm containers
+    load it with one (conditional) GET instead of scanning the table, and
+    the storefront can fetch latest.json.gz or the manifest directly.
+    Meant to live at module level so the last loaded copy is reused while
+    S3 reports it unchanged.
+    """
+    def __init__(self, prefix=SNAPSHOT_PREFIX):
+        self.bucket_name = os.environ.get('CATALOG_SNAPSHOT_BUCKET') or os.environ['S3_BUCKET_NAME']
+        self.latest_key = f"{prefix}/latest.json.gz"
+        self.manifest_key = f"{prefix}/manifest.json"
+        self.versions_prefix = f"{prefix}/versions/"
+        self.local_write_at = 0.0
+        self._loaded = None  # (S3 ETag, catalog entry)
+
+    def note_local_write(self):
+        """Record that this container changed the catalog, so older snapshots aren't used"""
+        self.local_write_at = time.time()
+
+    def publish(self, catalog, scanned_at):
+        """Write a catalog entry as the latest snapshot, its versioned copy and the
+        manifest (last, so it never points at a missing object); returns the manifest"""
+        version = catalog['etag'].strip('"')
+        compressed = gzip.compress(catalog['body'].encode('utf-8'), mtime=0)
+        version_key = f"{self.versions_prefix}{version}.json.gz"
+        metadata = {
+            'version': version,
+            'scanned-at': repr(scanned_at),
+            'product-count': str(len(catalog['products']))
+        }
+
+        s3 = get_client('s3')
+        for key, cache_control in ((version_key, VERSION_CACHE_CONTROL), (self.latest_key, LATEST_CACHE_CONTROL)):
+            s3.put_object(
+                Bucket=self.bucket_name,
+                Key=key,
+                Body=compressed,
+                ContentType='application/json',
+                ContentEncoding='gzip',
+                CacheControl=cache_control,
+                Metadata=metadata
+            )
+
+        manifest = {
+            'version': version,
+            'etag': catalog['etag'],
+            'url': f"https://{self.bucket_name}.s3.amazonaws.com/{version_key}",
+            'latest_url': f"https://{self.bucket_name}.s3.amazonaws.com/{self.latest_key}",
+            'product_count': len(catalog['products']),
+            'last_modified': catalog['last_modified'],
+            'scanned_at': scanned_at,
+            'generated_at': datetime.utcnow().isoformat(),
+            'size': len(catalog['body'].encode('utf-8')),
+            'compressed_size': len(compressed)
+        }
+        s3.put_object(
+            Bucket=self.bucket_name,
+            Key=self.manifest_key,
+            Body=json.dumps(manifest).encode('utf-8'),
+            ContentType='application/json',
+            CacheControl=MANIFEST_CACHE_CONTROL
+        )
+        return manifest
+
+    def load(self):
+        """Catalog entry from the latest snapshot, or None if there is none or it
+        predates a write made by this container"""
+        s3 = get_client('s3')
+        params = {'Bucket': self.bucket_name, 'Key': self.latest_key}
+        if self._loaded and self._fresh(self._loaded[1]):
+            # One conditional GET; S3 answers 304 while the snapshot is unchanged
+            return self._get(s3, dict(params, IfNoneMatch=self._loaded[0]))
+
+        # Check the scan time with a HEAD first, so a snapshot too old for a
+        # local write isn't downloaded and parsed only to be thrown away
+        try:
+            head = s3.head_object(**params)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+                return None
+            raise
+        scanned_at = _scanned_at(head)
+        if scanned_at < self.local_write_at + CLOCK_SKEW_SECONDS:
+            return None
+        if self._loaded and head['ETag'] == self._loaded[0]:
+            # Republished with the same content; only its scan time moved on
+            self._loaded[1]['scanned_at'] = scanned_at
+            return self._loaded[1]
+        return self._get(s3, params)
+
+    def _get(self, s3, params):
+        """Download and parse the latest snapshot, reusing the loaded copy on a 304"""
+        try:
+            response = s3.get_object(**params)
+        except ClientError as e:
+            code = e.response.get('Error', {}).get('Code')
+            if code in ('304', 'NotModified') and self._loaded:
+                return self._loaded[1]
+            if code in ('NoSuchKey', '404'):
+                return None
+            raise
+
+        body = gzip.decompress(response['Body'].read()).decode('utf-8')
+        # Numbers come back as Decimal, as they do from DynamoDB
+        products = json.loads(body, parse_float=Decimal, parse_int=Decimal)
+        catalog = catalog_entry(products, body)
+        catalog['scanned_at'] = _scanned_at(response)
+        self._loaded = (response['ETag'], catalog)
+        return self._fresh(catalog)
+
+    def _fresh(self, catalog):
+        """The catalog, unless it was scanned before this container's last write"""
+        if catalog['scanned_at'] < self.local_write_at + CLOCK_SKEW_SECONDS:
+            return None
+        return catalog
+
+def _scanned_at(response):
+    """Scan time recorded in a snapshot object's metadata (0 if missing)"""
+    return float(response.get('Metadata', {}).get('scanned-at', 0))
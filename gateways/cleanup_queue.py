@@ -0,0 +1,65 @@
+import os
+import json
+from gateways.aws_clients import get_client
+
+# DeleteObjects accepts at most 1000 keys per call
+DELETE_OBJECTS_LIMIT = 1000
+
+# SQS limits: 10 messages per SendMessageBatch; keys per message stay well under 256 KB
+SEND_BATCH_LIMIT = 10
+KEYS_PER_MESSAGE = 200
+
+class CleanupQueue:
+    """S3 objects to delete off the request path.
+
+    Keys are sent to the cleanup SQS queue (CLEANUP_QUEUE_URL) and deleted in
+    batches by handlers/cleanup_handler.py, which retries failures through
+    the queue. Without a queue configured, keys are deleted right away.
+    """
+    def __init__(self):
+        self.bucket_name = os.environ['S3_BUCKET_NAME']
+        self.queue_url = os.environ.get('CLEANUP_QUEUE_URL')
+
+    def enqueue(self, keys):
+        """Schedule objects for deletion; returns the number of keys accepted"""
+        keys = list(dict.fromkeys(key for key in keys if key))
+        if not keys:
+            return 0
+        if not self.queue_url:
+            failed = delete_objects(get_client('s3'), self.bucket_name, keys)
+            for key, error in failed.items():
+                print(f"Error deleting {key}: {error}")
+            return len(keys) - len(failed)
+
+        messages = [keys[start:start + KEYS_PER_MESSAGE] for start in range(0, len(keys), KEYS_PER_MESSAGE)]
+        sqs = get_client('sqs')
+        for start in range(0, len(messages), SEND_BATCH_LIMIT):
+            entries = [
+                {'Id': str(index), 'MessageBody': json.dumps({'bucket': self.bucket_name, 'keys': message_keys})}
+                for index, message_keys in enumerate(messages[start:start + SEND_BATCH_LIMIT])
+            ]
+            response = sqs.send_message_batch(QueueUrl=self.queue_url, Entries=entries)
+            if response.get('Failed'):
+                # Not worth failing the caller's delete over; fall back to deleting now
+                failed_ids = {failure['Id'] for failure in response['Failed']}
+                leftover = [key for entry in entries if entry['Id'] in failed_ids
+                            for key in json.loads(entry['MessageBody'])['keys']]
+                delete_objects(get_client('s3'), self.bucket_name, leftover)
+        return len(keys)
+
+def delete_objects(s3, bucket_name, keys):
+    """Delete keys with batched DeleteObjects calls; returns {key: error} for failures"""
+    failed = {}
+    for start in range(0, len(keys), DELETE_OBJECTS_LIMIT):
+        chunk = keys[start:start + DELETE_OBJECTS_LIMIT]
+        try:
+            response = s3.delete_objects(
+                Bucket=bucket_name,
+                Delete={'Objects': [{'Key': key} for key in chunk], 'Quiet': True}
+            )
+        except Exception as e:
+            failed.update({key: str(e) for key in chunk})
+            continue
+        for error in response.get('Errors', []):
+            failed[error['Key']] = error.get('Message') or error.get('Code')
+    return failed
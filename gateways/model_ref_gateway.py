@@ -0,0 +1,75 @@
+from gateways.base_gateway import BaseGateway
+import os
+from datetime import datetime
+
+class ModelRefGateway(BaseGateway):
+    """Reference counts for content-addressed model objects, keyed by SHA-256.
+
+    Each item records how many products/orders use a stored file and the S3
+    key holding it. The object is deleted when the last reference goes.
+    """
+    def __init__(self):
+        super().__init__(os.environ['MODEL_REFS_TABLE_NAME'], id_field='content_hash')
+
+    def acquire(self, content_hash):
+        """Add a reference and return the item (object_key is missing while nobody has stored the file)"""
+        response = self.client.update_item(
+            TableName=self.table.name,
+            Key={self.id_field: content_hash},
+            UpdateExpression='ADD ref_count :one SET updated_at = :now',
+            ExpressionAttributeValues={':one': 1, ':now': datetime.utcnow().isoformat()},
+            ReturnValues='ALL_NEW'
+        )
+        return response['Attributes']
+
+    def set_object_key(self, content_hash, object_key):
+        """Record where the file is stored, unless another upload already did.
+
+        Returns the key that won, which callers should use from then on.
+        """
+        conditional_check_failed = self.dynamodb.meta.client.exceptions.ConditionalCheckFailedException
+        try:
+            self.client.update_item(
+                TableName=self.table.name,
+                Key={self.id_field: content_hash},
+                UpdateExpression='SET object_key = :key',
+                ConditionExpression='attribute_exists(content_hash) AND attribute_not_exists(object_key)',
+                ExpressionAttributeValues={':key': object_key}
+            )
+            return object_key
+        except conditional_check_failed:
+            item = self.client.get_item(
+                TableName=self.table.name, Key={self.id_field: content_hash}, ConsistentRead=True
+            ).get('Item')
+            return item.get('object_key') if item else None
+
+    def release(self, content_hash):
+        """Drop a reference; returns the object key to delete if it was the last one"""
+        conditional_check_failed = self.dynamodb.meta.client.exceptions.ConditionalCheckFailedException
+        try:
+            response = self.client.update_item(
+                TableName=self.table.name,
+                Key={self.id_field: content_hash},
+                UpdateExpression='ADD ref_count :minus_one SET updated_at = :now',
+                ConditionExpression='attribute_exists(content_hash)',
+                ExpressionAttributeValues={':minus_one': -1, ':now': datetime.utcnow().isoformat()},
+                ReturnValues='ALL_NEW'
+            )
+        except conditional_check_failed:
+            return None
+        if response['Attributes'].get('ref_count', 0) > 0:
+            return None
+
+        # Only remove the record if nobody acquired the file again meanwhile; a
+        # later acquire then starts from an empty record and stores a new copy
+        try:
+            response = self.client.delete_item(
+                TableName=self.table.name,
+                Key={self.id_field: content_hash},
+                ConditionExpression='ref_count <= :zero',
+                ExpressionAttributeValues={':zero': 0},
+                ReturnValues='ALL_OLD'
+            )
+        except conditional_check_failed:
+            return None
+        return response.get('Attributes', {}).get('object_key')
@@ -0,0 +1,135 @@
+import os
+import uuid
+import hashlib
+from urllib.parse import urlparse, unquote
+from botocore.exceptions import ClientError
+from models.glb_model import GlbModel, GLB_HEADER_SIZE, CHUNK_HEADER_SIZE
+from gateways.s3_uploader import Base64File, upload_file, PART_SIZE
+
+# Prefix of content-addressed model objects, shared by product and order uploads
+CONTENT_PREFIX = 'models/sha256'
+
+# Bytes fetched by the first ranged GET of a stored model; enough for the
+# header and JSON chunk of most files, so one request usually suffices
+MODEL_HEAD_BYTES = int(os.environ.get('MODEL_HEAD_BYTES', str(64 * 1024)))
+
+# GetObject error codes meaning there is no usable model file at the key
+MISSING_OBJECT_ERRORS = ('NoSuchKey', '404', 'AccessDenied', '403', 'InvalidRange', '416')
+
+def inspect_model(file_content, file_name=None):
+    """Validate a GLB file about to be uploaded (bytes or a Base64File).
+
+    Returns (stats, errors); stats is None for files that aren't GLB. A
+    Base64File is only decoded as far as its JSON chunk, so large uploads
+    are still streamed to S3 without being held decoded in memory.
+    """
+    if isinstance(file_content, Base64File):
+        prefix = file_content.decode_head(GLB_HEADER_SIZE + CHUNK_HEADER_SIZE)
+        if not GlbModel.looks_like_glb(prefix, file_name):
+            return None, []
+        head = file_content.decode_head(GlbModel.head_size(prefix))
+        return _inspect(GlbModel(head, total_size=file_content.decoded_size()))
+
+    if not GlbModel.looks_like_glb(file_content, file_name):
+        return None, []
+    return _inspect(GlbModel(file_content))
+
+def inspect_stored_model(s3, bucket_name, model_url):
+    """Validate a GLB file already uploaded to the bucket (e.g. through a presigned
+    URL) with ranged GETs of its head, returning (stats, errors).
+
+    URLs outside the bucket and files that aren't GLB give (None, []).
+    """
+    file_key = key_from_url(bucket_name, model_url)
+    if not file_key:
+        return None, []
+
+    try:
+        response = s3.get_object(Bucket=bucket_name, Key=file_key, Range=f"bytes=0-{MODEL_HEAD_BYTES - 1}")
+    except ClientError as e:
+        # Without s3:ListBucket a missing key is reported as AccessDenied, and
+        # an empty object can't satisfy the range
+        if e.response.get('Error', {}).get('Code') in MISSING_OBJECT_ERRORS:
+            return None, [f"Model file not found: {model_url}"]
+        raise
+    head = response['Body'].read()
+    total_size = _object_size(response, len(head))
+    if not GlbModel.looks_like_glb(head, file_key):
+        return None, []
+
+    # The JSON chunk is larger than the first read; fetch the rest of it
+    needed = min(GlbModel.head_size(head), total_size)
+    if needed > len(head):
+        response = s3.get_object(Bucket=bucket_name, Key=file_key, Range=f"bytes={len(head)}-{needed - 1}")
+        head += response['Body'].read()
+    return _inspect(GlbModel(head, total_size=total_size))
+
+def content_hash(file_content):
+    """SHA-256 hex digest of bytes or a Base64File, decoding one part at a time"""
+    digest = hashlib.sha256()
+    if isinstance(file_content, Base64File):
+        for chunk in file_content.iter_chunks(PART_SIZE):
+            digest.update(chunk)
+    else:
+        digest.update(file_content)
+    return digest.hexdigest()
+
+def store_model(s3, bucket_name, model_refs, file_content, file_name, content_type='model/gltf-binary'):
+    """Store a model under a content-addressed key, skipping the upload when the
+    same bytes are already stored, and take a reference on it.
+
+    Returns (object_key, content_hash); release the reference with
+    ModelRefGateway.release, which hands back the key to delete after the last one.
+    """
+    file_hash = content_hash(file_content)
+    ref = model_refs.acquire(file_hash)
+    if ref.get('object_key'):
+        return ref['object_key'], file_hash
+
+    try:
+        # Every copy gets its own key so a copy being deleted after its last
+        # release can never remove a fresh upload of the same content
+        extension = os.path.splitext(file_name)[1].lower()
+        object_key = f"{CONTENT_PREFIX}/{file_hash}-{uuid.uuid4().hex[:12]}{extension}"
+        upload_file(s3, bucket_name, object_key, file_content, content_type)
+
+        stored_key = model_refs.set_object_key(file_hash, object_key)
+        if stored_key != object_key:
+            # A concurrent upload of the same file won; use its copy
+            s3.delete_object(Bucket=bucket_name, Key=object_key)
+        return stored_key, file_hash
+    except Exception:
+        model_refs.release(file_hash)
+        raise
+
+def object_url(bucket_name, object_key):
+    """Public URL of an object in the bucket"""
+    return f"https://{bucket_name}.s3.amazonaws.com/{object_key}"
+
+def content_hash_from_key(object_key):
+    """SHA-256 of a content-addressed object key, or None for other keys"""
+    if not object_key or not object_key.startswith(CONTENT_PREFIX + '/'):
+        return None
+    file_hash = object_key[len(CONTENT_PREFIX) + 1:].split('-', 1)[0]
+    return file_hash if len(file_hash) == 64 else None
+
+def key_from_url(bucket_name, model_url):
+    """Object key for a URL in the bucket, or None if it points elsewhere"""
+    parsed = urlparse(model_url or '')
+    if parsed.netloc.split('.', 1)[0] != bucket_name or '.s3' not in parsed.netloc:
+        return None
+    return unquote(parsed.path.lstrip('/')) or None
+
+def _object_size(response, read_size):
+    """Full object size from a ranged GET response"""
+    content_range = response.get('ContentRange')
+    if content_range and '/' in content_range:
+        return int(content_range.rsplit('/', 1)[1])
+    return read_size
+
+def _inspect(glb_model):
+    """Validation errors, or the model's stats ready for DynamoDB"""
+    errors = glb_model.validate()
+    if errors:
+        return None, [f"Invalid GLB model: {error}" for error in errors]
+    return glb_model.to_dynamodb(), []
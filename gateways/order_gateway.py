@@ -1,253 +1,368 @@
 from gateways.base_gateway import BaseGateway
 import os
-import boto3
-import uuid
+import json
+from gateways.aws_clients import get_client
+from boto3.dynamodb.conditions import Key, Attr
 from models.order_model import OrderModel
+from gateways.order_pipeline import Pipeline, PipelineStage
 from gateways.product_gateway import ProductGateway
+from gateways.model_storage import inspect_model, inspect_stored_model, store_model, object_url, key_from_url
+from gateways.user_gateway import UserGateway
+from gateways.model_ref_gateway import ModelRefGateway
+from gateways.cleanup_queue import CleanupQueue
+from boto3.dynamodb.types import TypeDeserializer
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
+from datetime import datetime
+
+# DynamoDB limit on actions per TransactWriteItems call
+MAX_TRANSACT_ITEMS = 100
+
+# Threads applying a bulk status change
+BULK_STATUS_WORKERS = int(os.environ.get('BULK_STATUS_WORKERS', '16'))
+
+_deserializer = TypeDeserializer()
 
 class OrderGateway(BaseGateway):
     def __init__(self):
-        super().__init__(os.environ['ORDER_TABLE_NAME'], id_field='order_id')
+        super().__init__(
+            os.environ['ORDER_TABLE_NAME'],
+            id_field='order_id',
+            scan_segments=int(os.environ.get('ORDER_SCAN_SEGMENTS', '4'))
+        )
         self.product_gateway = ProductGateway()
-        self.s3 = boto3.client('s3')
+        self._user_gateway = None
+        self._model_refs = None
+        self.create_pipeline = self._build_create_pipeline()
         self.bucket_name = os.environ['S3_BUCKET_NAME']
+        self.cleanup = CleanupQueue()
+        self.user_index = os.environ.get('ORDER_USER_INDEX_NAME', 'user_id-created_at-index')
+        self.status_index = os.environ.get('ORDER_STATUS_INDEX_NAME', 'status-created_at-index')
     
-    def create_order_with_model(self, order_data, file_content=None, file_name=None):
-        """Create a new order with validation, inventory check, and optional model file"""
-        # Create the order model
-        order_model = OrderModel(order_data)
-        
-        # Validate basic order data
-        errors = order_model.validate()
+    @property
+    def s3(self):
+        """Shared S3 client, created on first use"""
+        return get_client('s3')
+    
+    @property
+    def user_gateway(self):
+        """User gateway used for shipping address lookups, created on first use"""
+        if self._user_gateway is None:
+            self._user_gateway = UserGateway()
+        return self._user_gateway
+    
+    @property
+    def model_refs(self):
+        """Reference counts of stored model files, created on first use"""
+        if self._model_refs is None:
+            self._model_refs = ModelRefGateway()
+        return self._model_refs
+    
+    def create_order(self, order_data, file_content=None, file_name=None, custom_model_urls=None):
+        """Create a new order with validation, pricing, atomic stock reservation and
+        optional custom models (an inline file as bytes or a Base64File, and/or URLs
+        already uploaded to S3)"""
+        context = {
+            'order_model': OrderModel(order_data),
+            'file_content': file_content,
+            'file_name': file_name,
+            'custom_model_urls': custom_model_urls or []
+        }
+        
+        errors = self.create_pipeline.run(context)
+        print(json.dumps({
+            'event': 'order_pipeline',
+            'order_id': context['order_model'].order_data.get('order_id'),
+            'timings_ms': context['timings']
+        }))
         if errors:
             return {'errors': errors}
+        return context['order']
+    
+    def _build_create_pipeline(self):
+        """Order creation stages; address lookup, product fetch and model handling are independent"""
+        return Pipeline([
+            PipelineStage('validate', self._validate_stage),
+            PipelineStage('shipping_address', self._shipping_address_stage, after=['validate']),
+            PipelineStage('products', self._products_stage, after=['validate']),
+            PipelineStage('upload_model', self._upload_model_stage, after=['validate'], undo=self._undo_upload_model),
+            PipelineStage('inspect_models', self._inspect_models_stage, after=['validate']),
+            PipelineStage('pricing', self._pricing_stage, after=['products']),
+            PipelineStage('reserve', self._reserve_stage, after=['shipping_address', 'pricing', 'upload_model', 'inspect_models'])
+        ])
+    
+    def _validate_stage(self, context):
+        """Validate basic order data"""
+        return context['order_model'].validate()
+    
+    def _shipping_address_stage(self, context):
+        """Fill in the shipping address from the user's profile if none was given"""
+        order_data = context['order_model'].order_data
+        if 'shipping_address' in order_data:
+            return None
+        
+        user = self.user_gateway.get_by_id(order_data['user_id'])
+        if user and 'address' in user:
+            order_data['shipping_address'] = user['address']
+            return None
+        return ['User address not found. Please update your profile or provide a shipping address.']
+    
+    def _products_stage(self, context):
+        """Fetch every product in the order once, shared by pricing and inventory"""
+        context['products'] = self._fetch_products(context['order_model'].order_data['items'])
+        return None
+    
+    def _pricing_stage(self, context):
+        """Calculate prices and total amount"""
+        return self._calculate_order_total(context['order_model'].order_data, context['products'])
+    
+    def _upload_model_stage(self, context):
+        """Upload an inline custom model file and attach custom model URLs"""
+        order_data = context['order_model'].order_data
         
-        # Get user information for shipping address
-        if 'shipping_address' not in order_model.order_data:
-            from gateways.user_gateway import UserGateway
-            user_gateway = UserGateway()
-            user = user_gateway.get_by_id(order_model.order_data['user_id'])
-            if user and 'address' in user:
-                order_model.order_data['shipping_address'] = user['address']
-            else:
-                return {'errors': ['User address not found. Please update your profile or provide a shipping address.']}
-        
-        # Calculate prices and total amount
-        calculation_errors = self._calculate_order_total(order_model.order_data)
-        if calculation_errors:
-            return {'errors': calculation_errors}
-        
-        # Check inventory and update product stock
-        inventory_errors = self._check_and_update_inventory(order_model.order_data['items'])
-        if inventory_errors:
-            return {'errors': inventory_errors}
-        
-        # Handle custom model file upload if provided
+        file_content = context['file_content']
+        file_name = context['file_name']
         if file_content and file_name:
+            # Validate GLB files before they are stored
+            stats, errors = inspect_model(file_content, file_name)
+            if errors:
+                return errors
+            if stats:
+                order_data['custom_model_stats'] = stats
+            
             try:
-                # Generate S3 key for the file
-                file_key = f"order_models/{order_model.order_data['order_id']}/{uuid.uuid4()}-{file_name}"
-                
-                # Upload file to S3
-                self.s3.put_object(
-                    Bucket=self.bucket_name,
-                    Key=file_key,
-                    Body=file_content,
-                    ContentType='model/gltf-binary'  # Proper MIME type for GLB files
+                # Store the file once per distinct content, so repeat orders of the same model skip the upload
+                file_key, file_hash = store_model(
+                    self.s3, self.bucket_name, self.model_refs, file_content, file_name
                 )
+                context['model_hash'] = file_hash
                 
-                # Set the custom_model_url in the order data
-                order_model.order_data['custom_model_url'] = f"https://{self.bucket_name}.s3.amazonaws.com/{file_key}"
-                
+                # Set the custom model URL and content hash in the order data
+                order_data['custom_model_url'] = object_url(self.bucket_name, file_key)
+                order_data['custom_model_hash'] = file_hash
             except Exception as e:
-                return {'errors': [f"Error uploading custom model file: {str(e)}"]}
-        
-        # Create the order
-        return self.create(order_model.order_data)
+                return [f"Error uploading custom model file: {str(e)}"]
+        
+        # Store models the client already uploaded through presigned URLs
+        custom_model_urls = context['custom_model_urls']
+        if custom_model_urls:
+            if len(custom_model_urls) == 1:
+                # If there's only one URL, store it in the custom_model field for backward compatibility
+                order_data['custom_model'] = custom_model_urls[0]
+            
+            # Always store the array of URLs in custom_models field
+            order_data['custom_models'] = custom_model_urls
+        return None
     
-    def create_order(self, order_data):
-        """Create a new order with validation and inventory check"""
-        # Create the order model
-        order_model = OrderModel(order_data)
+    def _inspect_models_stage(self, context):
+        """Validate GLB models uploaded through presigned URLs and record their stats"""
+        custom_model_urls = context['custom_model_urls']
+        if not custom_model_urls:
+            return None
         
-        # Validate basic order data
-        errors = order_model.validate()
+        errors = []
+        model_stats = []
+        for model_url in custom_model_urls:
+            stats, url_errors = inspect_stored_model(self.s3, self.bucket_name, model_url)
+            errors.extend(url_errors)
+            model_stats.append(stats)
         if errors:
-            return {'errors': errors}
-        
-        # Get user information for shipping address
-        if 'shipping_address' not in order_model.order_data:
-            from gateways.user_gateway import UserGateway
-            user_gateway = UserGateway()
-            user = user_gateway.get_by_id(order_model.order_data['user_id'])
-            if user and 'address' in user:
-                order_model.order_data['shipping_address'] = user['address']
-            else:
-                return {'errors': ['User address not found. Please update your profile or provide a shipping address.']}
-        
-        # Calculate prices and total amount
-        calculation_errors = self._calculate_order_total(order_model.order_data)
-        if calculation_errors:
-            return {'errors': calculation_errors}
-        
-        # Check inventory and update product stock
-        inventory_errors = self._check_and_update_inventory(order_model.order_data['items'])
-        if inventory_errors:
-            return {'errors': inventory_errors}
+            return errors
         
-        # Create the order
-        return self.create(order_model.order_data)
+        # Stats line up with custom_models; entries for non-GLB files are null
+        if any(model_stats):
+            context['order_model'].order_data['custom_models_stats'] = model_stats
+        return None
     
-    def create_order_with_model_url(self, order_data, custom_model_url, file_name):
-        """Create a new order with a custom model URL (already uploaded to S3)"""
-        # Create the order model
-        order_model = OrderModel(order_data)
-        
-        # Validate basic order data
-        errors = order_model.validate()
-        if errors:
-            return {'errors': errors}
-        
-        # Get user information for shipping address
-        if 'shipping_address' not in order_model.order_data:
-            from gateways.user_gateway import UserGateway
-            user_gateway = UserGateway()
-            user = user_gateway.get_by_id(order_model.order_data['user_id'])
-            if user and 'address' in user:
-                order_model.order_data['shipping_address'] = user['address']
-            else:
-                return {'errors': ['User address not found. Please update your profile or provide a shipping address.']}
-        
-        # Calculate prices and total amount
-        calculation_errors = self._calculate_order_total(order_model.order_data)
-        if calculation_errors:
-            return {'errors': calculation_errors}
-        
-        # Check inventory and update product stock
-        inventory_errors = self._check_and_update_inventory(order_model.order_data['items'])
-        if inventory_errors:
-            return {'errors': inventory_errors}
-        
-        # Store the custom model URL in the order data
-        order_model.order_data['custom_model'] = custom_model_url
-        
-        # Create the order
-        return self.create(order_model.order_data)
+    def _undo_upload_model(self, context):
+        """Don't keep a reference on the uploaded model if the order was rejected"""
+        if context.get('model_hash'):
+            self.cleanup.enqueue([self.model_refs.release(context['model_hash'])])
     
-    def create_order_with_multiple_models(self, order_data, custom_model_urls, file_names):
-        """Create a new order with multiple custom model URLs (already uploaded to S3)"""
-        # Create the order model
-        order_model = OrderModel(order_data)
-        
-        # Validate basic order data
-        errors = order_model.validate()
-        if errors:
-            return {'errors': errors}
-        
-        # Get user information for shipping address
-        if 'shipping_address' not in order_model.order_data:
-            from gateways.user_gateway import UserGateway
-            user_gateway = UserGateway()
-            user = user_gateway.get_by_id(order_model.order_data['user_id'])
-            if user and 'address' in user:
-                order_model.order_data['shipping_address'] = user['address']
-            else:
-                return {'errors': ['User address not found. Please update your profile or provide a shipping address.']}
-        
-        # Calculate prices and total amount
-        calculation_errors = self._calculate_order_total(order_model.order_data)
-        if calculation_errors:
-            return {'errors': calculation_errors}
-        
-        # Check inventory and update product stock
-        inventory_errors = self._check_and_update_inventory(order_model.order_data['items'])
-        if inventory_errors:
-            return {'errors': inventory_errors}
-        
-        # Store the custom model URLs in the order data
-        if len(custom_model_urls) == 1:
-            # If there's only one URL, store it in the custom_model field for backward compatibility
-            order_model.order_data['custom_model'] = custom_model_urls[0]
-        
-        # Always store the array of URLs in custom_models field
-        order_model.order_data['custom_models'] = custom_model_urls
-        
-        # Create the order
-        return self.create(order_model.order_data)
+    def _reserve_stage(self, context):
+        """Reserve stock and create the order in a single transaction"""
+        result = self._reserve_stock_and_create(context['order_model'].order_data, context['products'])
+        if 'errors' in result:
+            return result['errors']
+        context['order'] = result
+        return None
     
     def get_user_orders(self, user_id):
-        """Get all orders for a specific user"""
-        orders = self.query_by_attribute('user_id', user_id)
-        return self._sanitize_orders(orders)
+        """Get all orders for a specific user, newest first"""
+        orders = list(self.iter_query(
+            IndexName=self.user_index,
+            KeyConditionExpression=Key('user_id').eq(user_id),
+            ScanIndexForward=False
+        ))
+        return orders
     
-    def get_all(self):
-        """Get all orders with binary data removed"""
-        orders = super().get_all()
-        return self._sanitize_orders(orders)
+    def get_user_orders_page(self, user_id, limit, cursor=None):
+        """Get one page of a user's orders, newest first, with a cursor for the next page"""
+        orders, next_cursor = self.query_page(
+            limit=limit,
+            cursor=cursor,
+            IndexName=self.user_index,
+            KeyConditionExpression=Key('user_id').eq(user_id),
+            ScanIndexForward=False
+        )
+        return {
+            'orders': orders,
+            'next_cursor': next_cursor
+        }
     
-    def _sanitize_orders(self, orders):
-        """Remove any binary data from orders to ensure JSON serialization works"""
-        sanitized_orders = []
-        for order in orders:
-            sanitized_order = {}
-            for key, value in order.items():
-                if isinstance(value, (bytes, bytearray, memoryview)):
-                    # Skip binary data
-                    continue
-                elif isinstance(value, dict):
-                    # Handle nested dictionaries
-                    sanitized_order[key] = {k: v for k, v in value.items() 
-                                          if not isinstance(v, (bytes, bytearray, memoryview))}
-                elif isinstance(value, list):
-                    # Handle lists
-                    sanitized_order[key] = []
-                    for item in value:
-                        if isinstance(item, dict):
-                            sanitized_order[key].append({k: v for k, v in item.items()
-                                                      if not isinstance(v, (bytes, bytearray, memoryview))})
-                        elif not isinstance(item, (bytes, bytearray, memoryview)):
-                            sanitized_order[key].append(item)
-                else:
-                    sanitized_order[key] = value
-            sanitized_orders.append(sanitized_order)
-        return sanitized_orders
-    
-    def _check_and_update_inventory(self, items):
-        """Check if items are in stock and update inventory"""
-        errors = []
-        
-        # Create a list to track inventory updates
-        inventory_updates = []
-        
-        # Check each product's availability
-        for item in items:
-            product_id = item['product_id']
-            quantity = item['quantity']
-            
-            # Get the product
-            product = self.product_gateway.get_by_id(product_id)
-            if not product:
-                errors.append(f"Product with ID {product_id} not found")
-                continue
+    def list_orders_page(self, limit, cursor=None, status=None, created_from=None, created_to=None):
+        """Get one page of orders, newest first when filtered by status, optionally
+        bounded by created_at (ISO strings, inclusive), with a cursor for the next page.
+        
+        A status filter is a query on the status index and only reads matching
+        orders; without one the table is scanned with a created_at filter.
+        """
+        if status:
+            key_condition = Key('status').eq(status)
+            if created_from and created_to:
+                key_condition &= Key('created_at').between(created_from, created_to)
+            elif created_from:
+                key_condition &= Key('created_at').gte(created_from)
+            elif created_to:
+                key_condition &= Key('created_at').lte(created_to)
             
-            # Check if in stock (using quantity field)
-            if 'quantity' not in product or product['quantity'] < quantity:
-                errors.append(f"Not enough stock for product {product.get('name', product_id)}")
-                continue
+            orders, next_cursor = self.query_page(
+                limit=limit,
+                cursor=cursor,
+                IndexName=self.status_index,
+                KeyConditionExpression=key_condition,
+                ScanIndexForward=False
+            )
+        else:
+            scan_kwargs = {}
+            if created_from and created_to:
+                scan_kwargs['FilterExpression'] = Attr('created_at').between(created_from, created_to)
+            elif created_from:
+                scan_kwargs['FilterExpression'] = Attr('created_at').gte(created_from)
+            elif created_to:
+                scan_kwargs['FilterExpression'] = Attr('created_at').lte(created_to)
+            orders, next_cursor = self.scan_page(limit, cursor, **scan_kwargs)
+        
+        return {
+            'orders': orders,
+            'next_cursor': next_cursor
+        }
+    
+    def update_status_bulk(self, order_ids, status):
+        """Move many orders to a status, each with a conditional update that only
+        applies if the order exists and may move there from its current status.
+        
+        Updates run concurrently on a bounded pool. Returns one outcome per
+        order ID, in order: updated, unchanged, not_found, invalid_transition
+        or failed.
+        """
+        order_ids = list(dict.fromkeys(order_ids))
+        if not order_ids:
+            return []
+        
+        workers = max(1, min(BULK_STATUS_WORKERS, len(order_ids)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(lambda order_id: self._transition_status(order_id, status), order_ids))
+    
+    def _transition_status(self, order_id, status):
+        """Conditionally move one order to a status and describe the outcome"""
+        conditional_check_failed = self.dynamodb.meta.client.exceptions.ConditionalCheckFailedException
+        prior_statuses = OrderModel.prior_statuses(status)
+        values = {':status': status, ':now': datetime.utcnow().isoformat()}
+        placeholders = []
+        for index, prior in enumerate(prior_statuses):
+            values[f":prior{index}"] = prior
+            placeholders.append(f":prior{index}")
+        
+        condition = 'attribute_exists(order_id)'
+        if placeholders:
+            condition += f" AND #status IN ({', '.join(placeholders)})"
+        else:
+            condition += ' AND #status = :unreachable'  # Nothing can move to this status
+            values[':unreachable'] = None
+        
+        try:
+            # Runs on the bulk update workers, so through the thread-safe client
+            response = self.client.update_item(
+                TableName=self.table.name,
+                Key={self.id_field: order_id},
+                UpdateExpression='SET #status = :status, updated_at = :now',
+                ConditionExpression=condition,
+                ExpressionAttributeNames={'#status': 'status'},
+                ExpressionAttributeValues=values,
+                ReturnValues='ALL_OLD',
+                ReturnValuesOnConditionCheckFailure='ALL_OLD'
+            )
+            return {
+                'order_id': order_id,
+                'outcome': 'updated',
+                'previous_status': response['Attributes'].get('status')
+            }
+        except conditional_check_failed as e:
+            item = e.response.get('Item')
+            if not item:
+                return {'order_id': order_id, 'outcome': 'not_found'}
             
-            # Track inventory update
-            new_quantity = product['quantity'] - quantity
-            inventory_updates.append({'product_id': product_id, 'quantity': new_quantity})
-        
-        # If no errors, update all inventory at once
-        if not errors:
-            for update in inventory_updates:
-                self.product_gateway.update(update['product_id'], {'quantity': update['quantity']})
-        
-        return errors
+            current_status = _deserializer.deserialize(item['status']) if 'status' in item else None
+            if current_status == status:
+                return {'order_id': order_id, 'outcome': 'unchanged', 'previous_status': current_status}
+            return {
+                'order_id': order_id,
+                'outcome': 'invalid_transition',
+                'previous_status': current_status,
+                'error': f"Cannot move an order from {current_status} to {status}"
+            }
+        except Exception as e:
+            return {'order_id': order_id, 'outcome': 'failed', 'error': str(e)}
     
-    def _calculate_order_total(self, order_data):
+    def _fetch_products(self, items):
+        """Batch-fetch the products referenced by order items into a per-request cache"""
+        return self.product_gateway.batch_get_by_ids([item['product_id'] for item in items])
+    
+    def _reserve_stock_and_create(self, order_data, products):
+        """Decrement stock for every item and insert the order in one transaction"""
+        # Combine repeated products so each one is decremented once
+        reserved = {}
+        for item in order_data['items']:
+            reserved[item['product_id']] = reserved.get(item['product_id'], 0) + Decimal(str(item['quantity']))
+        
+        if len(reserved) >= MAX_TRANSACT_ITEMS:
+            return {'errors': [f"An order can contain at most {MAX_TRANSACT_ITEMS - 1} different products"]}
+        
+        # Each decrement only applies if enough stock is left, so concurrent
+        # orders cannot oversell a product
+        now = datetime.utcnow().isoformat()
+        transact_items = [{'Update': {
+            'TableName': self.product_gateway.table.name,
+            'Key': {self.product_gateway.id_field: product_id},
+            'UpdateExpression': 'ADD quantity :decrement SET updated_at = :now',
+            'ConditionExpression': 'attribute_exists(product_id) AND quantity >= :quantity',
+            'ExpressionAttributeValues': {':decrement': -quantity, ':quantity': quantity, ':now': now}
+        }} for product_id, quantity in reserved.items()]
+        transact_items.append({'Put': {
+            'TableName': self.table.name,
+            'Item': order_data,
+            'ConditionExpression': 'attribute_not_exists(order_id)'
+        }})
+        
+        try:
+            self.transact_write(transact_items)
+        except self.dynamodb.meta.client.exceptions.TransactionCanceledException as e:
+            # A failed check may mean our cached stock is stale
+            self.product_gateway.invalidate_cache(list(reserved))
+            # Cancellation reasons line up with transact_items, so map them back to products
+            errors = []
+            for product_id, code in zip(reserved, self.cancellation_reasons(e)):
+                if code == 'ConditionalCheckFailed':
+                    product = products.get(product_id) or {}
+                    errors.append(f"Not enough stock for product {product.get('name', product_id)}")
+            return {'errors': errors or ['Order could not be placed due to a conflicting update. Please try again.']}
+        
+        # Stock levels changed for every reserved product
+        self.product_gateway.invalidate_cache(list(reserved))
+        return order_data
+    
+    def _calculate_order_total(self, order_data, products):
         """Calculate total amount based on product prices"""
         errors = []
         total = 0
@@ -259,7 +374,7 @@ class OrderGateway(BaseGateway):
             quantity = item['quantity']
             
             # Get product details
-            product = self.product_gateway.get_by_id(product_id)
+            product = products.get(product_id)
             if not product:
                 errors.append(f"Product with ID {product_id} not found")
                 continue
@@ -318,20 +433,23 @@ class OrderGateway(BaseGateway):
         # Delete the order
         result = self.delete(order_id)
         
-        # If the order had a custom model, delete it from S3
-        if 'custom_model_url' in order:
-            try:
-                # Extract the key from the URL
-                url_parts = order['custom_model_url'].split('/')
-                key = '/'.join(url_parts[3:])  # Skip https://bucket-name.s3.amazonaws.com/
-                
-                # Delete the file from S3
-                self.s3.delete_object(
-                    Bucket=self.bucket_name,
-                    Key=key
-                )
-            except Exception as e:
-                # Log the error but don't fail the order deletion
-                print(f"Error deleting custom model file: {str(e)}")
+        # Schedule the order's model files for cleanup (content-addressed files
+        # are only deleted once no other order or product uses them)
+        try:
+            keys = []
+            if 'custom_model_hash' in order:
+                keys.append(self.model_refs.release(order['custom_model_hash']))
+            elif 'custom_model_url' in order:
+                keys.append(key_from_url(self.bucket_name, order['custom_model_url']))
+            
+            # Files the customer uploaded directly for this order
+            for url in order.get('custom_models', []):
+                key = key_from_url(self.bucket_name, url)
+                if key and key.startswith('orders/'):
+                    keys.append(key)
+            self.cleanup.enqueue(keys)
+        except Exception as e:
+            # Log the error but don't fail the order deletion
+            print(f"Error cleaning up custom model files: {str(e)}")
         
         return {'message': 'Order deleted successfully'}
\ No newline at end of file
@@ -0,0 +1,101 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# Threads shared by every pipeline run in a warm container
+PIPELINE_WORKERS = int(os.environ.get('ORDER_PIPELINE_WORKERS', '4'))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    """Lazily create the shared stage executor"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix='order-stage')
+        return _executor
+
+class PipelineStage:
+    """A named step of a pipeline.
+
+    `run(context)` returns a list of errors (empty or None on success).
+    `after` names the stages that must finish first; stages with no
+    dependency on each other run concurrently. `undo(context)` is called
+    for a finished stage when a later stage fails.
+    """
+    def __init__(self, name, run, after=(), undo=None):
+        self.name = name
+        self.run = run
+        self.after = tuple(after)
+        self.undo = undo
+
+class Pipeline:
+    """Runs stages as soon as their dependencies are done, recording each stage's timing"""
+    def __init__(self, stages):
+        self.stages = list(stages)
+        names = {stage.name for stage in self.stages}
+        for stage in self.stages:
+            missing = [name for name in stage.after if name not in names]
+            if missing:
+                raise ValueError(f"Stage {stage.name} depends on unknown stages: {', '.join(missing)}")
+
+    def run(self, context):
+        """Run every stage and return the errors of the first failing stage(s).
+
+        Timings in milliseconds are stored in context['timings'].
+        """
+        timings = context.setdefault('timings', {})
+        pending = list(self.stages)
+        running = {}
+        done = []
+        errors = []
+        failure = None
+
+        while pending or running:
+            # Start everything whose dependencies have completed, unless we are failing
+            if not errors and failure is None:
+                finished = {stage.name for stage in done}
+                for stage in [stage for stage in pending if all(name in finished for name in stage.after)]:
+                    pending.remove(stage)
+                    running[_get_executor().submit(self._run_stage, stage, context, timings)] = stage
+
+            if not running:
+                break  # Failing, or nothing else can start
+
+            completed, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in completed:
+                stage = running.pop(future)
+                try:
+                    stage_errors = future.result()
+                except Exception as e:
+                    failure = failure or e
+                    continue
+                if stage_errors:
+                    errors.extend(stage_errors)
+                else:
+                    done.append(stage)
+
+        if errors or failure is not None:
+            self._undo(done, context)
+            if failure is not None:
+                raise failure
+        return errors
+
+    def _run_stage(self, stage, context, timings):
+        """Run a single stage and record how long it took"""
+        started = time.perf_counter()
+        try:
+            return stage.run(context)
+        finally:
+            timings[stage.name] = round((time.perf_counter() - started) * 1000, 2)
+
+    def _undo(self, done, context):
+        """Compensate finished stages in reverse order"""
+        for stage in reversed(done):
+            if stage.undo:
+                try:
+                    stage.undo(context)
+                except Exception as e:
+                    print(f"Error undoing stage {stage.name}: {str(e)}")
@@ -1,46 +1,562 @@
 from gateways.base_gateway import BaseGateway
+from gateways.cache import LRUCache
+from gateways.search_index import SearchIndex
+from gateways.catalog_snapshot import CatalogSnapshot, catalog_entry
+from gateways.model_storage import (
+    inspect_model, inspect_stored_model, key_from_url, content_hash_from_key, store_model, object_url
+)
+from gateways.model_ref_gateway import ModelRefGateway
+from gateways.cleanup_queue import CleanupQueue
+from models.glb_model import GlbModel
+from decimal import Decimal
 import os
-import boto3
-import uuid
+import json
+import time
+from gateways.aws_clients import get_client
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from boto3.dynamodb.conditions import Key, Attr
+
+# Conditional stock updates retried when racing with concurrent changes
+MAX_STOCK_UPDATE_ATTEMPTS = 3
+
+# Catalog cache shared by every ProductGateway in a warm container
+product_cache = LRUCache(
+    'products',
+    max_size=int(os.environ.get('PRODUCT_CACHE_MAX_ITEMS', '2048')),
+    ttl=float(os.environ.get('PRODUCT_CACHE_TTL_SECONDS', '30'))
+)
+
+# Cache key for the full product listing
+CATALOG_CACHE_KEY = '__catalog__'
+
+# Catalog snapshot in S3, loaded on catalog cache misses instead of scanning the table
+catalog_snapshot = CatalogSnapshot()
+CATALOG_SNAPSHOT_ENABLED = os.environ.get('CATALOG_SNAPSHOT_ENABLED', 'false').lower() == 'true'
+
+# Search index of the catalog, kept in warm containers and reconciled with a
+# catalog snapshot at most this often (writes from this container apply at once)
+product_search_index = SearchIndex('product_id')
+SEARCH_INDEX_TTL_SECONDS = float(os.environ.get('SEARCH_INDEX_TTL_SECONDS', os.environ.get('PRODUCT_CACHE_TTL_SECONDS', '30')))
+
+# Sort orders of the filtered product listing
+LISTING_SORTS = ('price_asc', 'price_desc', 'name')
+
+# Level-of-detail variants built after a product model upload, as triangle budget ratios
+LOD_FUNCTION_NAME = os.environ.get('LOD_FUNCTION_NAME')
+LOD_RATIOS = [float(ratio) for ratio in os.environ.get('LOD_RATIOS', '0.5,0.1').split(',') if ratio.strip()]
+LOD_MIN_TRIANGLES = int(os.environ.get('LOD_MIN_TRIANGLES', '500'))
+
+# Threads queueing LOD generation for the models of a bulk import
+MAX_LOD_REQUEST_WORKERS = 8
 
 class ProductGateway(BaseGateway):
     def __init__(self):
         super().__init__(os.environ['PRODUCTS_TABLE_NAME'], id_field='product_id')
-        self.s3 = boto3.client('s3')
         self.bucket_name = os.environ['S3_BUCKET_NAME']
+        self.cleanup = CleanupQueue()
+        self.category_index = os.environ.get('PRODUCT_CATEGORY_INDEX_NAME', 'category-price-index')
+        self.model_url_index = os.environ.get('PRODUCT_MODEL_URL_INDEX_NAME', 'model_url-index')
+        self._model_refs = None
+    
+    @property
+    def s3(self):
+        """Shared S3 client, created on first use"""
+        return get_client('s3')
+    
+    @property
+    def model_refs(self):
+        """Reference counts of stored model files, created on first use"""
+        if self._model_refs is None:
+            self._model_refs = ModelRefGateway()
+        return self._model_refs
     
     def create_with_model_file(self, product_data, file_content=None, file_name=None):
-        """Create a product with an optional 3D model file"""
+        """Create a product with an optional 3D model file (bytes or a Base64File).
+        
+        GLB models are validated first and their stats stored as model_stats;
+        this also covers a model_url uploaded earlier through a presigned URL.
+        """
+        # model_hash tracks model_url and is never set directly
+        product_data.pop('model_hash', None)
         if file_content and file_name:
-            # Generate S3 key for the file
-            file_key = f"models/{uuid.uuid4()}-{file_name}"
+            stats, errors = inspect_model(file_content, file_name)
+            if errors:
+                return {'errors': errors}
+            if stats:
+                product_data['model_stats'] = stats
             
-            # Upload file to S3
-            self.s3.put_object(
-                Bucket=self.bucket_name,
-                Key=file_key,
-                Body=file_content,
-                ContentType='model/gltf-binary'  # Proper MIME type for GLB files
+            # Store the file once per distinct content (base64 files are streamed as a multipart upload)
+            file_key, product_data['model_hash'] = store_model(
+                self.s3, self.bucket_name, self.model_refs, file_content, file_name
             )
             
             # Set the model_url in the product data
-            product_data['model_url'] = f"https://{self.bucket_name}.s3.amazonaws.com/{file_key}"
+            product_data['model_url'] = object_url(self.bucket_name, file_key)
+        elif product_data.get('model_url'):
+            if 'model_stats' not in product_data:
+                stats, errors = inspect_stored_model(self.s3, self.bucket_name, product_data['model_url'])
+                if errors:
+                    return {'errors': errors}
+                if stats:
+                    product_data['model_stats'] = stats
+            
+            # A product cloned from another one shares its stored file, so it takes a reference too
+            file_hash = self._acquire_model(product_data['model_url'])
+            if file_hash:
+                product_data['model_hash'] = file_hash
         
         # Create the product in DynamoDB
-        return self.create(product_data)
+        try:
+            result = self.create(product_data)
+        except Exception:
+            if product_data.get('model_hash'):
+                self._release_model(product_data['model_hash'])
+            raise
+        if result.get('model_stats'):
+            self.request_model_lods(result)
+        return result
+    
+    def request_model_lods(self, product):
+        """Queue LOD generation for a product's GLB model in the LOD function.
+        
+        Runs asynchronously so uploads don't wait for it; a failure to queue
+        only means the product is served without LOD variants.
+        """
+        if not LOD_FUNCTION_NAME or not product.get('model_url'):
+            return False
+        try:
+            get_client('lambda').invoke(
+                FunctionName=LOD_FUNCTION_NAME,
+                InvocationType='Event',
+                Payload=json.dumps({
+                    'product_id': product[self.id_field],
+                    'model_url': product['model_url']
+                })
+            )
+            return True
+        except Exception as e:
+            print(f"Error requesting model LODs for {product[self.id_field]}: {str(e)}")
+            return False
+    
+    def generate_model_lods(self, product_id, model_url):
+        """Build decimated variants of a product model, store them next to the
+        original and record them on the product as model_lods"""
+        # NumPy-heavy, so only loaded by the LOD function
+        from models.glb_lod import build_lods
+        
+        file_key = key_from_url(self.bucket_name, model_url)
+        if not file_key:
+            return {'errors': [f"Model is not stored in the bucket: {model_url}"]}
+        
+        glb_model = GlbModel(self.s3.get_object(Bucket=self.bucket_name, Key=file_key)['Body'].read())
+        errors = glb_model.validate()
+        if errors:
+            return {'errors': errors}
+        
+        model_lods = []
+        stem = os.path.splitext(file_key)[0]
+        for lod in build_lods(glb_model, LOD_RATIOS, LOD_MIN_TRIANGLES):
+            lod_key = f"{stem}-lod{round(lod['ratio'] * 100)}.glb"
+            self.s3.put_object(Bucket=self.bucket_name, Key=lod_key, Body=lod['data'], ContentType='model/gltf-binary')
+            model_lods.append({
+                'ratio': Decimal(str(lod['ratio'])),
+                'model_url': object_url(self.bucket_name, lod_key),
+                'triangle_count': lod['triangle_count'],
+                'vertex_count': lod['vertex_count'],
+                'byte_size': len(lod['data'])
+            })
+        
+        updates = {'model_lods': model_lods, 'updated_at': datetime.utcnow().isoformat()}
+        # Bulk-imported products get their stats here rather than at creation
+        product = super().get_by_id(product_id)
+        if product and 'model_stats' not in product:
+            updates['model_stats'] = glb_model.to_dynamodb()
+        
+        # Only written if the product still has this model, so a model replaced
+        # (or a product deleted) meanwhile never gets LODs of the old one
+        conditional_check_failed = self.dynamodb.meta.client.exceptions.ConditionalCheckFailedException
+        try:
+            response = self.table.update_item(
+                Key={self.id_field: product_id},
+                ConditionExpression=Attr('model_url').eq(model_url),
+                ReturnValues='ALL_NEW',
+                **self._build_update_params(updates)
+            )
+        except conditional_check_failed:
+            self.cleanup.enqueue([key_from_url(self.bucket_name, lod['model_url']) for lod in model_lods])
+            return {'errors': ['Product model changed while LODs were generated']}
+        
+        self.invalidate_cache([product_id])
+        product_search_index.add(response['Attributes'])
+        return {'product_id': product_id, 'model_lods': model_lods}
+    
+    def create(self, item):
+        """Create a product and drop stale cache entries"""
+        # Always stamped here: clients don't get to set the catalog's Last-Modified
+        item['updated_at'] = datetime.utcnow().isoformat()
+        result = super().create(item)
+        self.invalidate_cache([result[self.id_field]])
+        product_search_index.add(result)
+        return result
+    
+    def batch_create(self, items):
+        """Create many products at once and drop stale cache entries"""
+        now = datetime.utcnow().isoformat()
+        for item in items:
+            item['updated_at'] = now
+            # Rows pointing at stored files take a reference, as single creates do
+            item.pop('model_hash', None)
+            file_hash = self._acquire_model(item.get('model_url'))
+            if file_hash:
+                item['model_hash'] = file_hash
+        results = super().batch_create(items)
+        self.invalidate_cache([result[self.id_field] for result in results if result['status'] == 'created'])
+        created_models = []
+        for result in results:
+            item = items[result['index']]
+            if result['status'] == 'created':
+                product_search_index.add(item)
+                if self._is_stored_glb(item.get('model_url')):
+                    created_models.append(item)
+            elif item.get('model_hash'):
+                self._release_model(item['model_hash'])
+        
+        # Imported rows aren't inspected inline; the LOD function validates their
+        # models and fills in model_stats along with the LOD variants
+        if created_models:
+            with ThreadPoolExecutor(max_workers=min(MAX_LOD_REQUEST_WORKERS, len(created_models))) as executor:
+                list(executor.map(self.request_model_lods, created_models))
+        return results
+    
+    def get_all(self, total_segments=None):
+        """Get all products, served from the warm-container cache when fresh"""
+        # Hand out copies so callers can't mutate the cached entries
+        return [dict(product) for product in self.get_catalog(total_segments)['products']]
+    
+    def get_catalog(self, total_segments=None):
+        """Get the full catalog with its serialized body, ETag and last modification time.
+        
+        The body and version are computed once per cache fill, so conditional
+        requests can be answered without serializing the catalog again.
+        """
+        catalog = product_cache.get(CATALOG_CACHE_KEY)
+        if catalog is None:
+            catalog = self._load_snapshot() or self.scan_catalog(total_segments)
+            product_cache.set(CATALOG_CACHE_KEY, catalog)
+        return catalog
+    
+    def scan_catalog(self, total_segments=None, consistent_read=False):
+        """Build a catalog entry from a full table scan"""
+        scan_kwargs = {'ConsistentRead': True} if consistent_read else {}
+        products = list(self.iter_all(total_segments=total_segments, **scan_kwargs))
+        # Stable order so identical catalogs hash identically in every container
+        products.sort(key=lambda product: product[self.id_field])
+        return catalog_entry(products)
+    
+    def _load_snapshot(self):
+        """Catalog entry from the S3 snapshot, or None to fall back to a scan"""
+        if not CATALOG_SNAPSHOT_ENABLED:
+            return None
+        try:
+            return catalog_snapshot.load()
+        except Exception as e:
+            print(f"Error loading catalog snapshot: {str(e)}")
+            return None
+    
+    def publish_catalog_snapshot(self):
+        """Scan the table and publish the result as the catalog snapshot; returns its manifest"""
+        scanned_at = time.time()
+        catalog = self.scan_catalog(consistent_read=True)
+        manifest = catalog_snapshot.publish(catalog, scanned_at)
+        product_cache.set(CATALOG_CACHE_KEY, catalog)
+        return manifest
+    
+    def list_products_page(self, limit, cursor=None, category=None, min_price=None, max_price=None, sort='price_asc'):
+        """Get one page of products, optionally in one category and price range
+        (Decimals, inclusive), with a cursor for the next page.
+        
+        A category sorted by price is a query on the category index and only
+        reads that page; other listings filter and sort the cached catalog.
+        """
+        if category and sort in ('price_asc', 'price_desc'):
+            # Catalog listing cursors don't carry a table key
+            if cursor and 'after' in self.decode_cursor(cursor):
+                raise ValueError('Invalid cursor')
+            key_condition = Key('category').eq(category)
+            if min_price is not None and max_price is not None:
+                key_condition &= Key('price').between(min_price, max_price)
+            elif min_price is not None:
+                key_condition &= Key('price').gte(min_price)
+            elif max_price is not None:
+                key_condition &= Key('price').lte(max_price)
+            
+            products, next_cursor = self.query_page(
+                limit=limit,
+                cursor=cursor,
+                IndexName=self.category_index,
+                KeyConditionExpression=key_condition,
+                ScanIndexForward=sort == 'price_asc'
+            )
+            return {'products': products, 'next_cursor': next_cursor}
+        
+        def sort_key(product):
+            if sort == 'name':
+                return (str(product.get('name', '')).lower(), product[self.id_field])
+            return (Decimal(str(product.get('price', 0))), product[self.id_field])
+        
+        products = [
+            product for product in self.get_catalog()['products']
+            if (not category or product.get('category') == category)
+            and (min_price is None or Decimal(str(product.get('price', 0))) >= min_price)
+            and (max_price is None or Decimal(str(product.get('price', 0))) <= max_price)
+        ]
+        descending = sort == 'price_desc'
+        products.sort(key=sort_key, reverse=descending)
+        
+        # The cursor holds the sort key of the last product returned, so pages
+        # stay consistent when products are added or removed in between
+        if cursor:
+            after = self.decode_cursor(cursor).get('after')
+            if not isinstance(after, list) or len(after) != 2:
+                raise ValueError('Invalid cursor')
+            after = tuple(Decimal(str(value)) if isinstance(value, (int, float, Decimal)) else value for value in after)
+            try:
+                products = [product for product in products
+                            if (sort_key(product) < after if descending else sort_key(product) > after)]
+            except TypeError:
+                raise ValueError('Invalid cursor')  # Cursor of a listing with another sort
+        
+        page = [dict(product) for product in products[:limit]]
+        next_cursor = None
+        if len(products) > limit:
+            next_cursor = self.encode_cursor({'after': list(sort_key(page[-1]))})
+        return {'products': page, 'next_cursor': next_cursor}
+    
+    def get_by_id(self, item_id):
+        """Get a product by ID, served from the warm-container cache when fresh"""
+        product = product_cache.get(item_id)
+        if product is None:
+            product = super().get_by_id(item_id)
+            if product is None:
+                return None
+            product_cache.set(item_id, product)
+        return dict(product)
+    
+    def batch_get_by_ids(self, item_ids):
+        """Get many products by ID, only fetching the ones not already cached"""
+        found = {}
+        missing = []
+        for item_id in dict.fromkeys(item_ids):
+            product = product_cache.get(item_id)
+            if product is None:
+                missing.append(item_id)
+            else:
+                found[item_id] = dict(product)
+        
+        if missing:
+            for item_id, product in super().batch_get_by_ids(missing).items():
+                product_cache.set(item_id, product)
+                found[item_id] = dict(product)
+        return found
+    
+    def update(self, item_id, updates):
+        """Update a product and drop stale cache entries.
+        
+        A new model_url moves the product's model reference: the new file is
+        acquired before the write and the old one released after it.
+        """
+        updates = dict(updates, updated_at=datetime.utcnow().isoformat())
+        # model_hash tracks model_url and is never set directly
+        updates.pop('model_hash', None)
+        if 'model_url' in updates:
+            result = self._update_model_url(item_id, updates)
+        else:
+            result = super().update(item_id, updates)
+        self.invalidate_cache([item_id])
+        if result:
+            product_search_index.add(result)
+        return result
+    
+    def _update_model_url(self, item_id, updates):
+        """Apply an update that sets model_url, moving the model reference with it"""
+        updates['model_hash'] = self._acquire_model(updates['model_url'])
+        try:
+            # The old values come back from the write itself, so a concurrent
+            # model change can't make us release the wrong reference
+            previous = self.table.update_item(
+                Key={self.id_field: item_id},
+                ReturnValues='ALL_OLD',
+                **self._build_update_params(updates)
+            ).get('Attributes')
+        except Exception:
+            if updates['model_hash']:
+                self._release_model(updates['model_hash'])
+            raise
+        
+        if previous and previous.get('model_hash'):
+            self._release_model(previous['model_hash'])
+        return dict(previous or {self.id_field: item_id}, **updates)
+    
+    def delete(self, item_id):
+        """Delete a product, schedule its model files for cleanup and drop stale cache entries"""
+        result = super().delete(item_id)
+        self.invalidate_cache([item_id])
+        product_search_index.remove(item_id)
+        if not result or not result.get('model_url'):
+            return result
+        
+        try:
+            if result.get('model_hash'):
+                # Content-addressed files go once no product or order uses them
+                model_key = self.model_refs.release(result['model_hash'])
+            else:
+                model_key = key_from_url(self.bucket_name, result['model_url'])
+                # Content-addressed files are only ever removed through their references
+                if content_hash_from_key(model_key):
+                    model_key = None
+                elif not model_key or not model_key.startswith('models/'):
+                    model_key = None
+                elif self._model_url_shared(result['model_url'], item_id):
+                    model_key = None
+            
+            if model_key:
+                # LOD variants live next to the model and go with it
+                lod_keys = [key_from_url(self.bucket_name, lod['model_url']) for lod in result.get('model_lods', [])]
+                self.cleanup.enqueue([model_key] + lod_keys)
+        except Exception as e:
+            # Log the error but don't fail the product deletion
+            print(f"Error cleaning up model files of product {item_id}: {str(e)}")
+        return result
+    
+    def _is_stored_glb(self, model_url):
+        """Whether a model URL points at a GLB file in the bucket"""
+        if not isinstance(model_url, str):
+            return False
+        file_key = key_from_url(self.bucket_name, model_url)
+        return bool(file_key) and file_key.lower().endswith('.glb')
+    
+    def _model_url_shared(self, model_url, item_id):
+        """Whether another product still points at a model URL, looked up on the model_url index"""
+        response = self.table.query(
+            IndexName=self.model_url_index,
+            KeyConditionExpression=Key('model_url').eq(model_url),
+            Limit=2
+        )
+        return any(item[self.id_field] != item_id for item in response.get('Items', []))
+    
+    def _acquire_model(self, model_url):
+        """Take a reference on a content-addressed model file; returns its hash, or
+        None if the URL isn't one or the file isn't stored (nothing to track)"""
+        if not isinstance(model_url, str):
+            return None
+        file_hash = content_hash_from_key(key_from_url(self.bucket_name, model_url))
+        if not file_hash:
+            return None
+        if self.model_refs.acquire(file_hash).get('object_key'):
+            return file_hash
+        self._release_model(file_hash)
+        return None
+    
+    def _release_model(self, file_hash):
+        """Drop a reference on a stored model file, deleting it if it was the last one"""
+        self.cleanup.enqueue([self.model_refs.release(file_hash)])
+    
+    def invalidate_cache(self, product_ids):
+        """Drop cached entries for changed products along with the cached catalog"""
+        product_cache.invalidate(CATALOG_CACHE_KEY, *product_ids)
+        catalog_snapshot.note_local_write()
+    
+    def cache_stats(self):
+        """Hit/miss counters of the product cache"""
+        return product_cache.stats()
+    
+    def get_search_index(self):
+        """Search index of the catalog, synced with the cached catalog once it gets stale"""
+        if not product_search_index.is_fresh(SEARCH_INDEX_TTL_SECONDS):
+            product_search_index.sync(self.get_catalog()['products'])
+        return product_search_index
+    
+    def search(self, query, limit=20):
+        """Products matching a search query, best first, with the total number of matches"""
+        product_ids, total = self.get_search_index().search(query, limit)
+        products = self.batch_get_by_ids(product_ids)
+        return {
+            'total': total,
+            'products': [products[product_id] for product_id in product_ids if product_id in products]
+        }
     
     def get_by_name(self, name):
-        """Get product by name"""
-        return self.query_by_attribute('name', name)
+        """Get products by exact name, looked up in the search index instead of a table scan"""
+        product_ids = self.get_search_index().ids_by_name(name)
+        products = self.batch_get_by_ids(product_ids)
+        return [products[product_id] for product_id in product_ids
+                if product_id in products and products[product_id].get('name') == name]
     
     def update_stock(self, product_id, quantity_change):
-        """Update the stock quantity of a product"""
-        product = self.get_by_id(product_id)
-        if not product:
-            return None
+        """Atomically add to a product's stock quantity, flooring it at zero.
+        
+        Returns a dict with the updated product, previous_quantity and
+        new_quantity, or None if the product does not exist.
+        """
+        conditional_check_failed = self.dynamodb.meta.client.exceptions.ConditionalCheckFailedException
+        quantity_change = int(quantity_change)
         
-        current_quantity = int(product.get('quantity', 0))
-        new_quantity = max(0, current_quantity + quantity_change)  # Prevent negative quantities
+        for _ in range(MAX_STOCK_UPDATE_ATTEMPTS):
+            # Apply the change in place; a decrement only applies if the stock covers it
+            condition = 'attribute_exists(product_id)'
+            values = {':change': quantity_change, ':now': datetime.utcnow().isoformat()}
+            if quantity_change < 0:
+                condition += ' AND quantity >= :needed'
+                values[':needed'] = -quantity_change
+            
+            try:
+                response = self.table.update_item(
+                    Key={self.id_field: product_id},
+                    UpdateExpression='ADD quantity :change SET updated_at = :now',
+                    ConditionExpression=condition,
+                    ExpressionAttributeValues=values,
+                    ReturnValues='ALL_NEW',
+                    ReturnValuesOnConditionCheckFailure='ALL_OLD'
+                )
+                product = response['Attributes']
+                new_quantity = int(product.get('quantity', 0))
+                self.invalidate_cache([product_id])
+                return {
+                    'product': product,
+                    'previous_quantity': new_quantity - quantity_change,
+                    'new_quantity': new_quantity
+                }
+            except conditional_check_failed as e:
+                if not e.response.get('Item'):
+                    return None  # Product does not exist
+            
+            # Not enough stock to subtract the full amount: floor at zero, unless
+            # the stock was topped up concurrently, in which case retry
+            try:
+                response = self.table.update_item(
+                    Key={self.id_field: product_id},
+                    UpdateExpression='SET quantity = :zero, updated_at = :now',
+                    ConditionExpression='attribute_exists(product_id) AND (attribute_not_exists(quantity) OR quantity < :needed)',
+                    ExpressionAttributeValues={
+                        ':zero': 0,
+                        ':needed': -quantity_change,
+                        ':now': datetime.utcnow().isoformat()
+                    },
+                    ReturnValues='ALL_OLD',
+                    ReturnValuesOnConditionCheckFailure='ALL_OLD'
+                )
+                product = response['Attributes']
+                previous_quantity = int(product.get('quantity', 0))
+                product['quantity'] = 0
+                self.invalidate_cache([product_id])
+                return {
+                    'product': product,
+                    'previous_quantity': previous_quantity,
+                    'new_quantity': 0
+                }
+            except conditional_check_failed as e:
+                if not e.response.get('Item'):
+                    return None  # Product was deleted concurrently
         
-        return self.update(product_id, {'quantity': new_quantity})
\ No newline at end of file
+        raise RuntimeError(f"Stock update for product {product_id} kept conflicting with concurrent updates")
\ No newline at end of file
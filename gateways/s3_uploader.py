@@ -0,0 +1,99 @@
+import os
+import binascii
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Multipart settings for streaming inline uploads (S3 needs parts of at least 5 MiB)
+PART_SIZE = int(os.environ.get('UPLOAD_PART_SIZE_BYTES', str(8 * 1024 * 1024)))
+MAX_CONCURRENT_PARTS = int(os.environ.get('UPLOAD_MAX_CONCURRENT_PARTS', '4'))
+
+class Base64File:
+    """A file received as base64 text in a JSON body, decoded only while it is uploaded"""
+    def __init__(self, text):
+        # Clients sometimes wrap base64 lines; decoding works on aligned chunks, so drop whitespace
+        if any(char in text for char in ' \r\n\t'):
+            text = ''.join(text.split())
+        self.text = text
+
+    def __bool__(self):
+        return bool(self.text)
+
+    def iter_chunks(self, chunk_size):
+        """Yield the decoded bytes in chunks of about chunk_size bytes"""
+        # 4 base64 characters decode to 3 bytes, so aligned slices decode independently
+        chunk_chars = max(4, (chunk_size // 3) * 4)
+        for start in range(0, len(self.text), chunk_chars):
+            yield binascii.a2b_base64(self.text[start:start + chunk_chars])
+
+    def decode_head(self, size):
+        """Decode only the first size bytes of the file"""
+        chars = -(-size // 3) * 4
+        return binascii.a2b_base64(self.text[:chars])[:size]
+
+    def decode(self):
+        """Decode the whole file at once (for small files)"""
+        return binascii.a2b_base64(self.text)
+
+    def decoded_size(self):
+        """Number of bytes the text decodes to"""
+        padding = len(self.text) - len(self.text.rstrip('='))
+        return len(self.text) // 4 * 3 - padding
+
+def upload_file(s3, bucket, key, file_content, content_type):
+    """Store raw bytes or a Base64File in S3 and return the stored size in bytes"""
+    if isinstance(file_content, Base64File):
+        return upload_base64(s3, bucket, key, file_content, content_type)
+
+    s3.put_object(Bucket=bucket, Key=key, Body=file_content, ContentType=content_type)
+    return len(file_content)
+
+def upload_base64(s3, bucket, key, base64_file, content_type,
+                  part_size=PART_SIZE, max_concurrency=MAX_CONCURRENT_PARTS):
+    """Decode base64 text chunk by chunk straight into an S3 multipart upload.
+
+    At most max_concurrency parts are in flight, so decoded data held in
+    memory stays around (max_concurrency + 1) * part_size bytes no matter
+    how large the file is.
+    """
+    if base64_file.decoded_size() <= part_size:
+        body = base64_file.decode()
+        s3.put_object(Bucket=bucket, Key=key, Body=body, ContentType=content_type)
+        return len(body)
+
+    upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key, ContentType=content_type)['UploadId']
+    try:
+        slots = threading.BoundedSemaphore(max_concurrency)
+        uploads = []
+        size = 0
+
+        def upload_part(part_number, data):
+            try:
+                response = s3.upload_part(
+                    Bucket=bucket, Key=key, UploadId=upload_id,
+                    PartNumber=part_number, Body=data
+                )
+                return {'PartNumber': part_number, 'ETag': response['ETag']}
+            finally:
+                slots.release()
+
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            for part_number, data in enumerate(base64_file.iter_chunks(part_size), start=1):
+                size += len(data)
+                # Wait for a free slot before decoding further, bounding buffered parts
+                slots.acquire()
+                if any(upload.done() and upload.exception() for upload in uploads):
+                    slots.release()
+                    break
+                uploads.append(executor.submit(upload_part, part_number, data))
+                del data
+
+        # Raises the first part failure, if any
+        parts = [upload.result() for upload in uploads]
+        s3.complete_multipart_upload(
+            Bucket=bucket, Key=key, UploadId=upload_id,
+            MultipartUpload={'Parts': parts}
+        )
+        return size
+    except Exception:
+        s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
@@ -0,0 +1,194 @@
+import re
+import heapq
+import math
+import time
+import threading
+import unicodedata
+
+# Fields indexed for search, with how much a match in each counts
+FIELD_WEIGHTS = {'name': 3.0, 'category': 2.0, 'description': 1.0}
+
+# Shortest prefix expanded to completions (a single letter would match most of the catalog)
+MIN_PREFIX_LENGTH = 2
+
+# Longest edge n-gram (token prefix) indexed; longer prefixes are checked against the candidates
+MAX_PREFIX_LENGTH = 12
+
+# Most a prefix match counts relative to a whole-token match (less for short prefixes)
+PREFIX_MATCH_WEIGHT = 0.5
+
+# Extra score for products whose name starts with the whole query
+NAME_PREFIX_BOOST = 2.0
+
+_token_pattern = re.compile(r'[^\W_]+')
+
+def normalize(text):
+    """Lowercase text with accents stripped, so 'Café' matches 'cafe'"""
+    decomposed = unicodedata.normalize('NFKD', str(text or ''))
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).lower()
+
+def tokenize(text):
+    """Split text into normalized word tokens"""
+    return _token_pattern.findall(normalize(text))
+
+class SearchIndex:
+    """In-memory inverted index over product name, category and description.
+
+    Whole tokens map to the products containing them (with a field-weighted
+    score), and edge n-grams map to the tokens they start, so the last word
+    of a query can be matched as a prefix while the user is still typing.
+    Meant to live at module level so it survives in a warm container; it is
+    kept current with add/remove on writes and reconciled with catalog
+    snapshots through sync.
+    """
+    def __init__(self, id_field):
+        self.id_field = id_field
+        self.synced_at = None
+        self._postings = {}   # token -> {item_id: weight}
+        self._prefixes = {}   # edge n-gram -> {token}
+        self._documents = {}  # item_id -> (indexed field values, {token: weight}, normalized name)
+        self._names = {}      # exact name -> {item_id}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._documents)
+
+    def is_fresh(self, ttl):
+        """Whether the index was synced with a snapshot in the last ttl seconds"""
+        return self.synced_at is not None and time.time() - self.synced_at < ttl
+
+    def sync(self, items):
+        """Reconcile the index with a full snapshot, only re-indexing items whose
+        indexed fields changed; returns the number of items added, changed or removed"""
+        changed = 0
+        with self._lock:
+            seen = set()
+            for item in items:
+                item_id = item[self.id_field]
+                seen.add(item_id)
+                document = self._documents.get(item_id)
+                if document is None or document[0] != self._field_values(item):
+                    self._remove(item_id)
+                    self._add(item)
+                    changed += 1
+            for item_id in [item_id for item_id in self._documents if item_id not in seen]:
+                self._remove(item_id)
+                changed += 1
+            self.synced_at = time.time()
+        return changed
+
+    def add(self, item):
+        """Index an item, replacing its previous version"""
+        with self._lock:
+            self._remove(item[self.id_field])
+            self._add(item)
+
+    def remove(self, item_id):
+        """Drop an item from the index"""
+        with self._lock:
+            self._remove(item_id)
+
+    def ids_by_name(self, name):
+        """IDs of items whose name is exactly the given one"""
+        with self._lock:
+            return sorted(self._names.get(name, ()))
+
+    def search(self, query, limit=None):
+        """Match every word of the query and return (best item IDs, total matches).
+
+        Earlier words must match whole tokens; the last one also matches as a
+        prefix unless the query ends with a space (the word is complete).
+        """
+        terms = tokenize(query)
+        if not terms:
+            return [], 0
+        last_is_prefix = not str(query)[-1:].isspace()
+        if last_is_prefix and len(terms) > 1 and len(terms[-1]) < MIN_PREFIX_LENGTH:
+            # Too short to narrow the results down yet
+            terms = terms[:-1]
+
+        with self._lock:
+            scores = None
+            for position, term in enumerate(terms):
+                matches = {term: 1.0} if term in self._postings else {}
+                if last_is_prefix and position == len(terms) - 1 and len(term) >= MIN_PREFIX_LENGTH:
+                    for token in self._prefix_tokens(term):
+                        # Closer completions count more: "ring" ranks "rings" above "ringmaster"
+                        matches[token] = PREFIX_MATCH_WEIGHT * (1 + len(term) / len(token)) / 2
+
+                term_scores = {}
+                for token, match_weight in matches.items():
+                    postings = self._postings[token]
+                    idf = math.log(1 + len(self._documents) / len(postings))
+                    for item_id, weight in postings.items():
+                        score = weight * match_weight * idf
+                        if score > term_scores.get(item_id, 0):
+                            term_scores[item_id] = score
+
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {item_id: score + term_scores[item_id] for item_id, score in scores.items() if item_id in term_scores}
+                if not scores:
+                    return [], 0
+
+            phrase = ' '.join(terms)
+            ranked = []
+            for item_id, score in scores.items():
+                name = self._documents[item_id][2]
+                if name.startswith(phrase):
+                    score += NAME_PREFIX_BOOST
+                ranked.append((-score, name, item_id))
+        best = heapq.nsmallest(limit, ranked) if limit is not None else sorted(ranked)
+        return [item_id for _, _, item_id in best], len(ranked)
+
+    def _field_values(self, item):
+        """Values of the indexed fields, in FIELD_WEIGHTS order"""
+        return tuple(str(item.get(field) or '') for field in FIELD_WEIGHTS)
+
+    def _prefix_tokens(self, term):
+        """Indexed tokens that start with term but aren't equal to it"""
+        tokens = self._prefixes.get(term[:MAX_PREFIX_LENGTH], ())
+        if len(term) > MAX_PREFIX_LENGTH:
+            tokens = [token for token in tokens if token.startswith(term)]
+        return [token for token in tokens if token != term]
+
+    def _add(self, item):
+        item_id = item[self.id_field]
+        values = self._field_values(item)
+        weights = {}
+        for field, value in zip(FIELD_WEIGHTS, values):
+            for token in set(tokenize(value)):
+                weights[token] = weights.get(token, 0) + FIELD_WEIGHTS[field]
+
+        for token, weight in weights.items():
+            postings = self._postings.setdefault(token, {})
+            if not postings:
+                for length in range(MIN_PREFIX_LENGTH, min(len(token), MAX_PREFIX_LENGTH) + 1):
+                    self._prefixes.setdefault(token[:length], set()).add(token)
+            postings[item_id] = weight
+        self._documents[item_id] = (values, weights, ' '.join(tokenize(values[0])))
+        self._names.setdefault(values[0], set()).add(item_id)
+
+    def _remove(self, item_id):
+        document = self._documents.pop(item_id, None)
+        if document is None:
+            return
+        values, weights, _ = document
+        for token in weights:
+            postings = self._postings[token]
+            postings.pop(item_id, None)
+            if postings:
+                continue
+            # Last item using the token: forget it and its n-grams
+            del self._postings[token]
+            for length in range(MIN_PREFIX_LENGTH, min(len(token), MAX_PREFIX_LENGTH) + 1):
+                tokens = self._prefixes[token[:length]]
+                tokens.discard(token)
+                if not tokens:
+                    del self._prefixes[token[:length]]
+
+        ids = self._names[values[0]]
+        ids.discard(item_id)
+        if not ids:
+            del self._names[values[0]]
@@ -0,0 +1,98 @@
+import json
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from json.encoder import encode_basestring_ascii
+from boto3.dynamodb.types import Binary
+
+# Values DynamoDB can hand back that have no JSON representation (B attributes
+# deserialize to Binary)
+BINARY_TYPES = (bytes, bytearray, memoryview, Binary)
+
+class _BinaryValue(Exception):
+    """Raised from inside the encoder when it meets a binary value"""
+
+def _encode_default(obj):
+    """Encode the non-JSON types found in DynamoDB items"""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, BINARY_TYPES):
+        raise _BinaryValue()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+# Uses the C-accelerated encoder; only Decimal/datetime/binary values call back into Python
+_encoder = json.JSONEncoder(default=_encode_default, check_circular=False)
+
+def to_json(data):
+    """Serialize API data to JSON in a single pass.
+
+    Decimal becomes float and date/datetime become ISO strings. Binary values
+    (and their keys) are left out. The output matches json.dumps with
+    DecimalEncoder for data without binary values.
+    """
+    try:
+        return _encoder.encode(data)
+    except _BinaryValue:
+        # Rare: only the containers that hold binary values are walked in Python
+        return _encode_filtered(data)
+
+def parse_timestamp(value):
+    """Parse a stored ISO timestamp into a naive UTC datetime, or None if it isn't one.
+    
+    Offsets (including a trailing Z, which fromisoformat only accepts from
+    Python 3.11) are converted to UTC.
+    """
+    if not isinstance(value, str):
+        return None
+    text = value.strip()
+    if text.endswith(('Z', 'z')):
+        text = text[:-1] + '+00:00'
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def to_json_array(pages):
+    """Serialize an iterable of item lists (e.g. scan pages) as one JSON array.
+    
+    Pages are encoded as they arrive, so only the current page's items are
+    held in memory next to the growing body.
+    """
+    parts = []
+    for page in pages:
+        if page:
+            parts.append(to_json(list(page))[1:-1])
+    return '[' + ', '.join(part for part in parts if part) + ']'
+
+def _encode_filtered(obj):
+    """Encode a container, skipping binary values"""
+    if isinstance(obj, dict):
+        return '{' + ', '.join(
+            _encode_key(key) + ': ' + _encode_value(value)
+            for key, value in obj.items()
+            if not isinstance(value, BINARY_TYPES)
+        ) + '}'
+    if isinstance(obj, (list, tuple)):
+        return '[' + ', '.join(
+            _encode_value(value) for value in obj if not isinstance(value, BINARY_TYPES)
+        ) + ']'
+    if isinstance(obj, BINARY_TYPES):
+        return 'null'
+    return _encoder.encode(obj)
+
+def _encode_value(value):
+    """Encode a value with the fast encoder, falling back for binary-holding containers"""
+    try:
+        return _encoder.encode(value)
+    except _BinaryValue:
+        return _encode_filtered(value)
+
+def _encode_key(key):
+    """Encode a dict key the way json.dumps does"""
+    if isinstance(key, str):
+        return encode_basestring_ascii(key)
+    return encode_basestring_ascii(_encoder.encode(key).strip('"'))
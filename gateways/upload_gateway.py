@@ -0,0 +1,93 @@
+import os
+import uuid
+from gateways.aws_clients import get_client
+
+# Lifetime of presigned upload URLs in seconds (SigV4 allows at most 7 days)
+UPLOAD_URL_EXPIRES_IN = int(os.environ.get('UPLOAD_URL_EXPIRES_IN', '3600'))
+MAX_UPLOAD_URL_EXPIRES_IN = 7 * 24 * 3600
+
+# Limits for one upload-URL request
+MAX_UPLOAD_FILES = int(os.environ.get('MAX_UPLOAD_FILES', '20'))
+MAX_UPLOAD_SIZE_BYTES = int(os.environ.get('MAX_UPLOAD_SIZE_BYTES', str(200 * 1024 * 1024)))
+
+class UploadGateway:
+    """Presigned S3 PUT URLs for direct uploads under one key prefix.
+
+    Signing uses the shared S3 client, so its endpoint resolution and
+    request signer are built once per container instead of per request.
+    """
+    def __init__(self, prefix, default_content_type=None, expires_in=None):
+        self.prefix = prefix.strip('/')
+        self.default_content_type = default_content_type
+        self.expires_in = clamp_expiry(UPLOAD_URL_EXPIRES_IN if expires_in is None else expires_in)
+        self.bucket_name = os.environ['S3_BUCKET_NAME']
+
+    @property
+    def s3(self):
+        return get_client('s3')
+
+    def validate_files(self, files):
+        """Check a list of {fileName, fileType, size} entries (size optional), returning errors"""
+        if not isinstance(files, list) or not files:
+            return ["files must be a non-empty list"]
+        if len(files) > MAX_UPLOAD_FILES:
+            return [f"At most {MAX_UPLOAD_FILES} files can be uploaded at once"]
+
+        errors = []
+        for index, entry in enumerate(files):
+            if not isinstance(entry, dict) or not entry.get('fileName'):
+                errors.append(f"files[{index}].fileName is required")
+                continue
+            # A given size is signed into the URL, so S3 rejects uploads of any other size
+            size = entry.get('size')
+            if size is None:
+                continue
+            if isinstance(size, bool) or not isinstance(size, int) or size < 0:
+                errors.append(f"files[{index}].size must be a non-negative integer")
+            elif size > MAX_UPLOAD_SIZE_BYTES:
+                errors.append(f"files[{index}] exceeds the maximum upload size of {MAX_UPLOAD_SIZE_BYTES} bytes")
+        return errors
+
+    def generate_upload_urls(self, files, expires_in=None):
+        """Sign one PUT URL per file entry; returns {'files': [...]} or {'errors': [...]}.
+
+        A requested expires_in can shorten, but not extend, the configured lifetime.
+        """
+        errors = self.validate_files(files)
+        if expires_in is not None:
+            try:
+                expires_in = min(self.expires_in, clamp_expiry(expires_in))
+            except (TypeError, ValueError):
+                errors.append("expiresIn must be an integer number of seconds")
+        if errors:
+            return {'errors': errors}
+
+        expires_in = self.expires_in if expires_in is None else expires_in
+        s3 = self.s3
+        results = []
+        for entry in files:
+            file_key = f"{self.prefix}/{uuid.uuid4()}-{entry['fileName']}"
+            params = {'Bucket': self.bucket_name, 'Key': file_key}
+            if entry.get('size') is not None:
+                params['ContentLength'] = entry['size']
+            content_type = entry.get('fileType') or self.default_content_type
+            if content_type:
+                params['ContentType'] = content_type
+
+            results.append({
+                'fileName': entry['fileName'],
+                'fileKey': file_key,
+                'uploadUrl': s3.generate_presigned_url('put_object', Params=params, ExpiresIn=expires_in),
+                'modelUrl': self.object_url(file_key)
+            })
+        return {'files': results, 'expiresIn': expires_in}
+
+    def object_url(self, file_key):
+        """Public URL of an object in the bucket"""
+        return f"https://{self.bucket_name}.s3.amazonaws.com/{file_key}"
+
+def clamp_expiry(expires_in):
+    """Keep a requested URL lifetime between one second and the SigV4 maximum"""
+    if isinstance(expires_in, bool):
+        raise TypeError("expires_in must be an integer")
+    return max(1, min(int(expires_in), MAX_UPLOAD_URL_EXPIRES_IN))
@@ -2,35 +2,161 @@ from gateways.base_gateway import BaseGateway
 import os
 from models.user_model import UserModel
 import jwt
+from boto3.dynamodb.conditions import Attr, Key
 from datetime import datetime, timedelta
 
+# Email uniqueness is enforced with a lock item per email address, written in
+# the same transaction as the user it belongs to
+EMAIL_LOCK_PREFIX = 'email#'
+EMAIL_LOCK_RECORD_TYPE = 'email_lock'
+
+def normalize_email(email):
+    """Canonical form of an email address, used for storage, lookups and locks"""
+    return email.strip().lower() if isinstance(email, str) else email
+
 class UserGateway(BaseGateway):
     def __init__(self):
         super().__init__(os.environ['USER_TABLE_NAME'], id_field='user_id')
         self.jwt_secret = os.environ['JWT_SECRET']
+        self.email_index = os.environ.get('USER_EMAIL_INDEX_NAME', 'email-index')
         
     def create_user(self, user_data):
         """Create a new user with validation"""
+        if 'email' in user_data:
+            user_data['email'] = normalize_email(user_data['email'])
         user_model = UserModel(user_data)
         validation_errors = user_model.validate()
         
         if validation_errors:
             return {'errors': validation_errors}
         
-        # Check if email already exists
+        # Check if email already exists (single keyed read on the email index)
         existing_user = self.get_by_email(user_data.get('email'))
         if existing_user:
             return {'errors': ['Email already registered']}
         
-        # Create the user
-        return self.create(user_model.user_data)
+        # Write the user and its email lock atomically so concurrent sign-ups
+        # with the same email cannot both succeed
+        user = user_model.user_data
+        try:
+            self.transact_write([
+                {'Put': {
+                    'TableName': self.table.name,
+                    'Item': user,
+                    'ConditionExpression': 'attribute_not_exists(user_id)'
+                }},
+                self._put_email_lock(user['email'], user['user_id'])
+            ])
+        except self.dynamodb.meta.client.exceptions.TransactionCanceledException:
+            return {'errors': ['Email already registered']}
+        
+        return user
     
     def get_by_email(self, email):
-        """Get user by email"""
-        result = self.query_by_attribute('email', email)
-        # Return the first user with the given email, or None if not found
+        """Get user by email, ignoring case and surrounding spaces"""
+        if not email or not isinstance(email, str):
+            return None
+        
+        user = self._query_email(normalize_email(email))
+        if user is None and email.strip() != normalize_email(email):
+            # Users registered before emails were normalized, until they are backfilled
+            user = self._query_email(email.strip())
+        return user
+    
+    def _query_email(self, email):
+        """First user stored with exactly this email on the email index, or None"""
+        response = self.table.query(
+            IndexName=self.email_index,
+            KeyConditionExpression=Key('email').eq(email),
+            Limit=1
+        )
+        result = response.get('Items', [])
         return result[0] if result else None
     
+    def iter_pages(self, total_segments=None, **scan_kwargs):
+        """Stream scan pages of users, leaving out email lock items"""
+        user_filter = Attr('record_type').not_exists()
+        if 'FilterExpression' in scan_kwargs:
+            user_filter = scan_kwargs['FilterExpression'] & user_filter
+        scan_kwargs['FilterExpression'] = user_filter
+        return super().iter_pages(total_segments=total_segments, **scan_kwargs)
+    
+    def list_users_page(self, limit, cursor=None):
+        """Get one page of users (without email lock items), with a cursor for the next page"""
+        users, next_cursor = self.scan_page(limit, cursor, FilterExpression=Attr('record_type').not_exists())
+        return {'users': users, 'next_cursor': next_cursor}
+    
+    def backfill_email_locks(self, dry_run=False):
+        """Normalize the email of users created before email locks existed and
+        write their lock items; returns counts of what was done.
+        
+        Each user is updated together with its lock in one transaction. Users
+        whose email is already locked by another user are reported and left
+        as they are.
+        """
+        counts = {'users': 0, 'locked': 0, 'already_locked': 0, 'conflicts': 0}
+        transaction_canceled = self.dynamodb.meta.client.exceptions.TransactionCanceledException
+        for user in self.iter_all():
+            email = user.get('email')
+            if not isinstance(email, str) or not email.strip():
+                continue
+            counts['users'] += 1
+            
+            lock = self.table.get_item(Key=self._email_lock_key(email), ConsistentRead=True).get('Item')
+            if lock and lock.get('owner_user_id') != user[self.id_field]:
+                print(f"Email {normalize_email(email)} of user {user[self.id_field]} is locked by {lock.get('owner_user_id')}")
+                counts['conflicts'] += 1
+                continue
+            if lock and email == normalize_email(email):
+                counts['already_locked'] += 1
+                continue
+            if dry_run:
+                counts['locked'] += 1
+                continue
+            
+            put_lock = self._put_email_lock(email, user[self.id_field])
+            put_lock['Put']['ConditionExpression'] = 'attribute_not_exists(user_id) OR owner_user_id = :owner'
+            put_lock['Put']['ExpressionAttributeValues'] = {':owner': user[self.id_field]}
+            try:
+                self.transact_write([
+                    put_lock,
+                    {'Update': {
+                        'TableName': self.table.name,
+                        'Key': {self.id_field: user[self.id_field]},
+                        'UpdateExpression': 'SET email = :email',
+                        'ConditionExpression': 'email = :current',
+                        'ExpressionAttributeValues': {':email': normalize_email(email), ':current': email}
+                    }}
+                ])
+                counts['locked'] += 1
+            except transaction_canceled:
+                print(f"Email {normalize_email(email)} of user {user[self.id_field]} changed or was taken meanwhile")
+                counts['conflicts'] += 1
+        return counts
+    
+    def _email_lock_key(self, email):
+        """Primary key of the lock item reserving an email address"""
+        return {self.id_field: f"{EMAIL_LOCK_PREFIX}{normalize_email(email)}"}
+    
+    def _put_email_lock(self, email, user_id):
+        """Transaction action that reserves an email for a user"""
+        return {'Put': {
+            'TableName': self.table.name,
+            'Item': {
+                **self._email_lock_key(email),
+                'record_type': EMAIL_LOCK_RECORD_TYPE,
+                'owner_user_id': user_id
+            },
+            'ConditionExpression': 'attribute_not_exists(user_id)'
+        }}
+    
+    def _delete_email_lock(self, email):
+        """Transaction action that releases an email reservation"""
+        return {'Delete': {
+            'TableName': self.table.name,
+            'Key': self._email_lock_key(email)
+        }}
+    
     def authenticate(self, email, password):
         """Authenticate a user and return a JWT token if successful"""
         user = self.get_by_email(email)
@@ -68,6 +194,8 @@ class UserGateway(BaseGateway):
         user_model = UserModel(existing_user)
         
         # Check if trying to update email and if it's already taken
+        if 'email' in update_data:
+            update_data['email'] = normalize_email(update_data['email'])
         if 'email' in update_data and update_data['email'] != existing_user.get('email'):
             existing_email = self.get_by_email(update_data['email'])
             if existing_email:
@@ -84,7 +212,32 @@ class UserGateway(BaseGateway):
             updated_data = temp_model.user_data
         
         # Update the user in the database
-        result = self.update(user_id, updated_data)
+        old_email = existing_user.get('email')
+        lock_moved = 'email' in update_data and (
+            not old_email or self._email_lock_key(update_data['email']) != self._email_lock_key(old_email)
+        )
+        if lock_moved:
+            # Move the email lock together with the user update
+            transact_items = [
+                self._put_email_lock(update_data['email'], user_id),
+                {'Update': {
+                    'TableName': self.table.name,
+                    'Key': {self.id_field: user_id},
+                    'ConditionExpression': 'attribute_exists(user_id)',
+                    **self._build_update_params(updated_data)
+                }}
+            ]
+            if old_email:
+                transact_items.append(self._delete_email_lock(old_email))
+            try:
+                self.transact_write(transact_items)
+            except self.dynamodb.meta.client.exceptions.TransactionCanceledException as e:
+                if self.cancellation_reasons(e)[0] == 'ConditionalCheckFailed':
+                    return {'errors': ['Email already registered']}
+                return {'errors': ['Failed to update user']}
+            result = self.get_by_id(user_id)
+        else:
+            result = self.update(user_id, updated_data)
         
         if not result:
             return {'errors': ['Failed to update user']}
@@ -98,10 +251,17 @@ class UserGateway(BaseGateway):
         if not existing_user:
             return {'errors': ['User not found']}
             
-        # Delete the user
-        result = self.delete(user_id)
-        
-        if not result:
+        # Delete the user together with its email lock
+        try:
+            transact_items = [{'Delete': {
+                'TableName': self.table.name,
+                'Key': {self.id_field: user_id},
+                'ConditionExpression': 'attribute_exists(user_id)'
+            }}]
+            if existing_user.get('email'):
+                transact_items.append(self._delete_email_lock(existing_user['email']))
+            self.transact_write(transact_items)
+        except self.dynamodb.meta.client.exceptions.TransactionCanceledException:
             return {'errors': ['Failed to delete user']}
             
         return {'message': 'User deleted successfully'}
\ No newline at end of file
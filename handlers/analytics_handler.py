@@ -0,0 +1,42 @@
+import json
+from datetime import date, timedelta
+from gateways.analytics_gateway import AnalyticsGateway
+from handlers.utils_handler import generate_response
+
+# Initialize gateway
+analytics_gateway = AnalyticsGateway()
+
+# Longest day range one dashboard request can cover
+MAX_DASHBOARD_DAYS = 366
+DEFAULT_DASHBOARD_DAYS = 30
+
+def process_order_stream(event, context):
+    """Update the order counters from a batch of orders-table stream records"""
+    records = event.get('Records', [])
+    
+    # Failures are raised so the whole batch is retried; parts that were already
+    # applied are skipped by the gateway
+    changed = analytics_gateway.apply_stream_batch(records)
+    print(json.dumps({'event': 'order_analytics', 'records': len(records), 'metrics_changed': changed}))
+    return {'records': len(records), 'metrics_changed': changed}
+
+def get_dashboard(event, context):
+    """Get order counters for the admin dashboard over a day range (admin function)"""
+    try:
+        query_params = event.get('queryStringParameters') or {}
+        try:
+            end = date.fromisoformat(query_params['to']) if query_params.get('to') else date.today()
+            start = (date.fromisoformat(query_params['from']) if query_params.get('from')
+                     else end - timedelta(days=DEFAULT_DASHBOARD_DAYS - 1))
+        except ValueError:
+            return generate_response(400, {"error": "from and to must be ISO dates (YYYY-MM-DD)"})
+        
+        day_count = (end - start).days + 1
+        if day_count < 1 or day_count > MAX_DASHBOARD_DAYS:
+            return generate_response(400, {"error": f"The date range must cover 1 to {MAX_DASHBOARD_DAYS} days"})
+        
+        days = [(start + timedelta(days=offset)).isoformat() for offset in range(day_count)]
+        return generate_response(200, analytics_gateway.get_dashboard(days))
+    
+    except Exception as e:
+        return generate_response(500, {"error": str(e)})
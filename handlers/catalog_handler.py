@@ -0,0 +1,22 @@
+import json
+from gateways.product_gateway import ProductGateway
+
+# Initialize gateway
+product_gateway = ProductGateway()
+
+def publish_snapshot(event, context):
+    """Republish the S3 catalog snapshot after a batch of products-table changes.
+    
+    The stream's batching window debounces bursts of writes into one rebuild;
+    failures are raised so the batch is retried.
+    """
+    records = event.get('Records', [])
+    manifest = product_gateway.publish_catalog_snapshot()
+    print(json.dumps({
+        'event': 'catalog_snapshot',
+        'records': len(records),
+        'version': manifest['version'],
+        'product_count': manifest['product_count'],
+        'compressed_size': manifest['compressed_size']
+    }))
+    return manifest
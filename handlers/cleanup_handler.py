@@ -0,0 +1,39 @@
+import os
+import json
+from gateways.aws_clients import get_client
+from gateways.cleanup_queue import delete_objects
+
+def drain(event, context):
+    """Delete the S3 objects queued by product and order deletes.
+
+    Keys from the whole SQS batch are deleted together with batched
+    DeleteObjects calls. Messages holding a key that failed are reported
+    back so SQS retries them (and eventually moves them to the DLQ).
+    """
+    keys_by_bucket = {}
+    messages_by_key = {}
+    failed_messages = set()
+    for record in event.get('Records', []):
+        try:
+            body = json.loads(record['body'])
+            bucket_name = body.get('bucket') or os.environ['S3_BUCKET_NAME']
+            keys = body['keys']
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Dropping malformed cleanup message {record.get('messageId')}: {str(e)}")
+            continue
+        for key in keys:
+            keys_by_bucket.setdefault(bucket_name, []).append(key)
+            messages_by_key.setdefault((bucket_name, key), set()).add(record['messageId'])
+
+    s3 = get_client('s3')
+    deleted = 0
+    for bucket_name, keys in keys_by_bucket.items():
+        keys = list(dict.fromkeys(keys))
+        failed = delete_objects(s3, bucket_name, keys)
+        deleted += len(keys) - len(failed)
+        for key, error in failed.items():
+            print(f"Error deleting {key}: {error}")
+            failed_messages.update(messages_by_key[(bucket_name, key)])
+
+    print(json.dumps({'event': 'cleanup', 'deleted': deleted, 'failed_messages': len(failed_messages)}))
+    return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in sorted(failed_messages)]}
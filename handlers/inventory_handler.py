@@ -26,24 +26,18 @@ def update_stock(event, context):
         except ValueError:
             return generate_response(400, {"error": "quantity_change must be an integer"})
         
-        # Check if product exists
-        existing_product = product_gateway.get_by_id(product_id)
-        if not existing_product:
+        # Atomically add to the existing quantity (single conditional update)
+        result = product_gateway.update_stock(product_id, quantity_change)
+        if not result:
             return generate_response(404, {"error": f"Product with ID {product_id} not found"})
         
-        # Update product stock by adding to existing quantity
-        updated_product = product_gateway.update_stock(product_id, quantity_change)
-        
-        if updated_product:
-            return generate_response(200, {
-                "message": f"Stock updated successfully for product {product_id}",
-                "previous_quantity": existing_product.get('quantity', 0),
-                "quantity_added": quantity_change,
-                "new_quantity": updated_product.get('quantity', 0),
-                "product": updated_product
-            })
-        else:
-            return generate_response(500, {"error": f"Failed to update stock for product {product_id}"})
+        return generate_response(200, {
+            "message": f"Stock updated successfully for product {product_id}",
+            "previous_quantity": result['previous_quantity'],
+            "quantity_added": quantity_change,
+            "new_quantity": result['new_quantity'],
+            "product": result['product']
+        })
     
     except Exception as e:
         return generate_response(500, {"error": str(e)})
\ No newline at end of file
@@ -0,0 +1,26 @@
+import json
+from gateways.product_gateway import ProductGateway
+
+# Initialize the product gateway
+product_gateway = ProductGateway()
+
+def generate_lods(event, context):
+    """Build LOD variants of a product model (invoked asynchronously after upload)"""
+    product_id = event.get('product_id')
+    model_url = event.get('model_url')
+    if not product_id or not model_url:
+        print(f"Skipping LOD generation, product_id and model_url are required: {json.dumps(event)}")
+        return {'errors': ['product_id and model_url are required']}
+    
+    # Errors other than a bad model are raised so the async invocation is retried
+    result = product_gateway.generate_model_lods(product_id, model_url)
+    print(json.dumps({
+        'event': 'model_lods',
+        'product_id': product_id,
+        'errors': result.get('errors', []),
+        'variants': [
+            {'ratio': float(lod['ratio']), 'triangle_count': lod['triangle_count'], 'byte_size': lod['byte_size']}
+            for lod in result.get('model_lods', [])
+        ]
+    }))
+    return {'product_id': product_id, 'errors': result.get('errors', [])}
@@ -1,11 +1,19 @@
 import json
-import base64
+from gateways.s3_uploader import Base64File
+from models.order_model import OrderModel
 from gateways.order_gateway import OrderGateway
-from handlers.utils_handler import generate_response, extract_user_from_token
-from decimal import Decimal
+from gateways.upload_gateway import UploadGateway
+from gateways.serializer import to_json_array, parse_timestamp
+from handlers.utils_handler import (
+    generate_response, generate_serialized_response, extract_user_from_token, generate_upload_url_response, parse_limit
+)
 
-# Initialize gateway
+# Initialize gateways
 order_gateway = OrderGateway()
+upload_gateway = UploadGateway('orders')
+
+# Largest number of orders one bulk status change can cover
+MAX_BULK_STATUS_ORDERS = 500
 
 def create(event, context):
     """Create a new order"""
@@ -15,42 +23,38 @@ def create(event, context):
         if not user:
             return generate_response(401, {"error": "Unauthorized. Authentication required."})
         
-        # Parse request body
-        body = json.loads(event.get('body', '{}'))
+        # Parse request body (and drop the raw body so large uploads aren't held twice)
+        body = json.loads(event.pop('body', None) or '{}')
         
         # Add user_id to order data
         body['user_id'] = user.get('user_id')
         
-        # Check for file content in base64 format
+        # Check for file content in base64 format; it is decoded while streaming to S3
         file_content = None
         file_name = None
         
         if 'custom_model_file' in body and 'file_name' in body:
-            try:
-                file_content = base64.b64decode(body['custom_model_file'])
-                file_name = body['file_name']
-                # Remove file data from body to avoid storing in DynamoDB
-                del body['custom_model_file']
-                del body['file_name']
-            except Exception as e:
-                return generate_response(400, {"error": f"Invalid base64 encoding: {str(e)}"})
+            if not isinstance(body['custom_model_file'], str):
+                return generate_response(400, {"error": "Invalid base64 encoding: custom_model_file must be a string"})
+            # Remove file data from body to avoid storing in DynamoDB
+            file_content = Base64File(body.pop('custom_model_file'))
+            file_name = body.pop('file_name')
+        
+        # Models already uploaded through presigned URLs
+        custom_model_urls = body.pop('custom_model_urls', None)
+        if custom_model_urls is not None and not isinstance(custom_model_urls, list):
+            return generate_response(400, {"error": "custom_model_urls must be a list"})
         
         # Create the order with server-side price calculation and user address
-        if file_content and file_name:
-            result = order_gateway.create_order_with_model(body, file_content, file_name)
-        else:
-            result = order_gateway.create_order(body)
+        result = order_gateway.create_order(body, file_content, file_name, custom_model_urls)
         
         # Check for errors
         if 'errors' in result:
             return generate_response(400, {"errors": result['errors']})
         
-        # Convert Decimal objects for JSON serialization
-        order = _convert_decimal(result)
-        
         return generate_response(201, {
             "message": "Order created successfully",
-            "order": order
+            "order": result
         })
     
     except Exception as e:
@@ -70,11 +74,25 @@ def get_user_orders(event, context):
         if not user:
             return generate_response(401, {"error": "Unauthorized. Authentication required."})
         
-        # Get user orders (already sanitized in the gateway)
         user_id = user.get('user_id')
-        orders = order_gateway.get_user_orders(user_id)
         
-        return generate_response(200, orders)
+        # Without paging parameters keep returning the full history as a list
+        query_params = event.get('queryStringParameters') or {}
+        if 'limit' not in query_params and 'cursor' not in query_params:
+            orders = order_gateway.get_user_orders(user_id)
+            return generate_response(200, orders)
+        
+        limit, error = parse_limit(query_params.get('limit'))
+        if error:
+            return generate_response(400, {"error": error})
+        
+        # Get one page of user orders (binary values are dropped when serialized)
+        try:
+            page = order_gateway.get_user_orders_page(user_id, limit, query_params.get('cursor'))
+        except ValueError as e:
+            return generate_response(400, {"error": str(e)})
+        
+        return generate_response(200, page)
     
     except Exception as e:
         # Handle binary data in error messages
@@ -86,12 +104,41 @@ def get_user_orders(event, context):
         return generate_response(500, {"error": error_msg})
 
 def get_all(event, context):
-    """Get all orders (admin function)"""
+    """Get orders (admin function), optionally filtered by status and created_at range"""
     try:
-        # Get all orders (already sanitized in the gateway)
-        orders = order_gateway.get_all()
+        # Without filter or paging parameters keep returning every order as a list
+        query_params = event.get('queryStringParameters') or {}
+        if not any(name in query_params for name in ('status', 'from', 'to', 'limit', 'cursor')):
+            # Serialized page by page, so the whole table is never held as items
+            # (binary values are dropped when serialized)
+            return generate_serialized_response(200, to_json_array(order_gateway.iter_pages()))
         
-        return generate_response(200, orders)
+        status = query_params.get('status')
+        if status and status not in OrderModel.STATUSES:
+            return generate_response(400, {
+                "error": f"Invalid status. Must be one of: {', '.join(OrderModel.STATUSES)}"
+            })
+        
+        limit, error = parse_limit(query_params.get('limit'))
+        if error:
+            return generate_response(400, {"error": error})
+        
+        created_from, error = _parse_created_at(query_params.get('from'), end_of_day=False)
+        if error:
+            return generate_response(400, {"error": f"from {error}"})
+        created_to, error = _parse_created_at(query_params.get('to'), end_of_day=True)
+        if error:
+            return generate_response(400, {"error": f"to {error}"})
+        if created_from and created_to and created_from > created_to:
+            return generate_response(400, {"error": "from cannot be later than to"})
+        
+        # Get one page of matching orders (binary values are dropped when serialized)
+        try:
+            page = order_gateway.list_orders_page(limit, query_params.get('cursor'), status, created_from, created_to)
+        except ValueError as e:
+            return generate_response(400, {"error": str(e)})
+        
+        return generate_response(200, page)
     
     except Exception as e:
         # Handle binary data in error messages
@@ -120,10 +167,9 @@ def update_status(event, context):
             return generate_response(400, {"error": "status is required in the request body"})
         
         # Valid status values
-        valid_statuses = ['pending', 'processing', 'shipped', 'delivered', 'cancelled']
-        if new_status not in valid_statuses:
+        if new_status not in OrderModel.STATUSES:
             return generate_response(400, {
-                "error": f"Invalid status. Must be one of: {', '.join(valid_statuses)}"
+                "error": f"Invalid status. Must be one of: {', '.join(OrderModel.STATUSES)}"
             })
         
         # Check if order exists
@@ -131,12 +177,10 @@ def update_status(event, context):
         if not existing_order:
             return generate_response(404, {"error": f"Order with ID {order_id} not found"})
         
-        # Update order status
+        # Admins may set any status here (e.g. to correct a mistake); only the
+        # bulk endpoint is limited to OrderModel.STATUS_TRANSITIONS
         updated_order = order_gateway.update(order_id, {"status": new_status})
         
-        # Convert any Decimal objects to float for JSON serialization
-        updated_order = _convert_decimal(updated_order)
-        
         if updated_order:
             return generate_response(200, {
                 "message": f"Order status updated to {new_status}",
@@ -154,6 +198,37 @@ def update_status(event, context):
             pass
         return generate_response(500, {"error": error_msg})
 
+def bulk_update_status(event, context):
+    """Move many orders to one status (admin function)"""
+    try:
+        # Parse request body
+        body = json.loads(event.get('body') or '{}')
+        order_ids = body.get('order_ids')
+        new_status = body.get('status')
+        
+        if not isinstance(order_ids, list) or not order_ids or not all(isinstance(order_id, str) for order_id in order_ids):
+            return generate_response(400, {"error": "order_ids must be a non-empty list of order IDs"})
+        if len(order_ids) > MAX_BULK_STATUS_ORDERS:
+            return generate_response(400, {"error": f"At most {MAX_BULK_STATUS_ORDERS} orders can be updated at once"})
+        if new_status not in OrderModel.STATUSES:
+            return generate_response(400, {
+                "error": f"Invalid status. Must be one of: {', '.join(OrderModel.STATUSES)}"
+            })
+        if not OrderModel.prior_statuses(new_status):
+            return generate_response(400, {"error": f"Orders cannot be moved to {new_status}"})
+        
+        # Each order is updated only if it exists and may move to the new status
+        results = order_gateway.update_status_bulk(order_ids, new_status)
+        updated = sum(1 for result in results if result['outcome'] == 'updated')
+        return generate_response(200, {
+            'status': new_status,
+            'updated': updated,
+            'results': results
+        })
+    
+    except Exception as e:
+        return generate_response(500, {"error": str(e)})
+
 def delete_order(event, context):
     """Delete an order (admin only)"""
     try:
@@ -174,7 +249,7 @@ def delete_order(event, context):
         return generate_response(500, {"error": f"Server error: {str(e)}"})
 
 def generate_upload_url(event, context):
-    """Generate a presigned URL for direct S3 upload"""
+    """Generate presigned URLs for direct S3 uploads of one or more files"""
     try:
         # Extract the token from the Authorization header
         auth_header = event.get('headers', {}).get('Authorization', '')
@@ -182,108 +257,23 @@ def generate_upload_url(event, context):
             return generate_response(401, {'error': 'No authorization token provided'})
         
         # Parse request body
-        body = json.loads(event.get('body', '{}'))
-        file_name = body.get('fileName')
-        file_type = body.get('fileType')
-        
-        # Check if this is a request for multiple files
-        is_multiple = body.get('isMultiple', False)
-        file_count = body.get('fileCount', 1) if is_multiple else 1
-        
-        if not file_name:
-            return generate_response(400, {"error": "fileName is required"})
-        
-        # Generate a unique file key
-        import uuid
-        import os
-        import boto3
-        
-        # Create S3 client
-        s3_client = boto3.client('s3')
-        bucket_name = os.environ['S3_BUCKET_NAME']
-        
-        if is_multiple:
-            # Generate multiple presigned URLs
-            upload_urls = []
-            model_urls = []
-            file_keys = []
-            
-            for i in range(file_count):
-                # Generate unique file key for each file
-                # Use index suffix for multiple files
-                indexed_file_name = f"{os.path.splitext(file_name)[0]}_{i}{os.path.splitext(file_name)[1]}" if file_count > 1 else file_name
-                file_key = f"orders/{uuid.uuid4()}-{indexed_file_name}"
-                file_keys.append(file_key)
-                
-                # Generate presigned URL for this file
-                presigned_url = s3_client.generate_presigned_url(
-                    'put_object',
-                    Params={
-                        'Bucket': bucket_name,
-                        'Key': file_key,
-                        'ContentType': file_type
-                    },
-                    ExpiresIn=3600  # URL expires in 1 hour
-                )
-                
-                upload_urls.append(presigned_url)
-                model_urls.append(f"https://{bucket_name}.s3.amazonaws.com/{file_key}")
-            
-            return generate_response(200, {
-                "uploadUrls": upload_urls,
-                "modelUrls": model_urls,
-                "fileKeys": file_keys
-            })
-        else:
-            # Original single file logic
-            file_key = f"orders/{uuid.uuid4()}-{file_name}"
-            
-            # Generate a presigned URL for uploading directly to S3
-            presigned_url = s3_client.generate_presigned_url(
-                'put_object',
-                Params={
-                    'Bucket': bucket_name,
-                    'Key': file_key,
-                    'ContentType': file_type
-                },
-                ExpiresIn=3600  # URL expires in 1 hour
-            )
-            
-            return generate_response(200, {
-                "uploadUrl": presigned_url,
-                "modelUrl": f"https://{bucket_name}.s3.amazonaws.com/{file_key}",
-                "fileKey": file_key
-            })
+        body = json.loads(event.get('body') or '{}')
+        return generate_upload_url_response(upload_gateway, body)
     except Exception as e:
         return generate_response(500, {"error": f"Server error: {str(e)}"})
 
-def _json_safe_encoder(obj):
-    """Handle non-JSON serializable objects"""
-    if isinstance(obj, Decimal):
-        return float(obj)
-    elif isinstance(obj, (bytes, bytearray, memoryview)):
-        return None  # Skip binary data
-    elif hasattr(obj, 'isoformat'):  # Handle date/datetime objects
-        return obj.isoformat()
-    else:
-        return str(obj)  # Convert other non-serializable objects to string
-
-def _convert_decimal(obj):
-    """Convert a single item's Decimal values to float and handle binary data"""
-    import base64
-    from botocore.response import StreamingBody
+def _parse_created_at(raw_value, end_of_day):
+    """Parse a from/to query parameter (an ISO date or datetime) into a created_at
+    bound, returning (bound, error); a bare `to` date covers that whole day.
     
-    if isinstance(obj, dict):
-        return {k: float(v) if isinstance(v, Decimal) 
-                else base64.b64encode(v).decode('utf-8') if isinstance(v, (bytes, bytearray, memoryview, StreamingBody))
-                else _convert_decimal(v) if isinstance(v, (dict, list)) 
-                else v 
-                for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [_convert_decimal(item) for item in obj]
-    elif isinstance(obj, Decimal):
-        return float(obj)
-    elif isinstance(obj, (bytes, bytearray, memoryview, StreamingBody)):
-        return base64.b64encode(obj).decode('utf-8')
-    else:
-        return obj
\ No newline at end of file
+    Bounds are naive UTC like the stored created_at values (offsets are
+    converted), so they compare correctly as strings.
+    """
+    if not raw_value:
+        return None, None
+    parsed = parse_timestamp(raw_value)
+    if parsed is None:
+        return None, "must be an ISO date (YYYY-MM-DD) or datetime"
+    if end_of_day and len(raw_value.strip()) == 10:
+        parsed = parsed.replace(hour=23, minute=59, second=59, microsecond=999999)
+    return parsed.isoformat(), None
@@ -1,30 +1,41 @@
 import json
 import os
 import base64
+from decimal import Decimal
 from models.product_model import ProductModel
-from gateways.product_gateway import ProductGateway
-from handlers.utils_handler import generate_response
-import boto3
-import uuid
+from gateways.product_gateway import ProductGateway, LISTING_SORTS
+from gateways.base_gateway import content_etag
+from gateways.serializer import to_json
+from gateways.s3_uploader import Base64File
+from gateways.upload_gateway import UploadGateway
+from handlers.utils_handler import (
+    generate_response, generate_conditional_response, generate_upload_url_response, parse_limit
+)
 
-# Initialize the product gateway
+# Initialize the gateways
 product_gateway = ProductGateway()
+upload_gateway = UploadGateway('models', default_content_type='model/gltf-binary')
+
+# Largest number of products one bulk import request can hold
+MAX_IMPORT_ROWS = int(os.environ.get('MAX_IMPORT_ROWS', '25000'))
+
+# Query parameters that turn the product listing into a filtered page
+LISTING_PARAMS = ('category', 'min_price', 'max_price', 'sort', 'limit', 'cursor')
 
 def create(event, context):
     """Create a new product with optional 3D model file"""
     try:
-        # Parse request body    
-        body = json.loads(event.get('body', '{}'))
+        # Parse request body (and drop the raw body so large uploads aren't held twice)
+        body = json.loads(event.pop('body', None) or '{}')
         
-        # Check for file content in base64 format
+        # Check for file content in base64 format; it is decoded while streaming to S3
         file_content = None
         file_name = None
         if 'model_file' in body and 'file_name' in body:
-            file_content = base64.b64decode(body['model_file'])
-            file_name = body['file_name']
-            # Remove file data from body to avoid storing in DynamoDB
-            del body['model_file']
-            del body['file_name']
+            if not isinstance(body['model_file'], str):
+                return generate_response(400, {"error": "Invalid base64 encoding: model_file must be a string"})
+            file_content = Base64File(body.pop('model_file'))
+            file_name = body.pop('file_name')
         
         # Set default category if not provided
         if 'category' not in body:
@@ -36,29 +47,170 @@ def create(event, context):
         if validation_errors:
             return generate_response(400, {"errors": validation_errors})
         
-        # Create product with optional file
-        if file_content and file_name:
-            result = product_gateway.create_with_model_file(
-                product_model.to_dict(), 
-                file_content, 
-                file_name
-            )
-        else:
-            result = product_gateway.create(product_model.to_dict())
+        # Create product with optional file (GLB models are validated and measured first)
+        result = product_gateway.create_with_model_file(
+            product_model.to_dict(), 
+            file_content, 
+            file_name
+        )
+        if 'errors' in result:
+            return generate_response(400, {"errors": result['errors']})
         
         return generate_response(201, result)
     
     except Exception as e:
         return generate_response(500, {"error": str(e)})
 
+def bulk_import(event, context):
+    """Create many products from a JSON array or NDJSON (one product per line)"""
+    try:
+        rows, line_errors, error = _parse_import_body(event.get('body') or '')
+        if error:
+            return generate_response(400, {"error": error})
+        if len(rows) > MAX_IMPORT_ROWS:
+            return generate_response(400, {"error": f"At most {MAX_IMPORT_ROWS} products can be imported at once"})
+        
+        # Validate every row; only valid ones are written
+        results = [None] * len(rows)
+        valid_rows = []
+        valid_indexes = []
+        for index, row in enumerate(rows):
+            errors = [line_errors[index]] if index in line_errors else _validate_import_row(row)
+            if errors:
+                results[index] = {'index': index, 'status': 'failed', 'errors': errors}
+                continue
+            valid_rows.append(ProductModel(row).to_dict())
+            valid_indexes.append(index)
+        
+        for result in product_gateway.batch_create(valid_rows):
+            index = valid_indexes[result['index']]
+            results[index] = dict(result, index=index)
+            if 'error' in result:
+                results[index]['errors'] = [results[index].pop('error')]
+        
+        created = sum(1 for result in results if result['status'] == 'created')
+        return generate_response(200, {
+            'created': created,
+            'failed': len(results) - created,
+            'results': results
+        })
+    
+    except Exception as e:
+        return generate_response(500, {"error": str(e)})
+
+def _parse_import_body(body):
+    """Parse a bulk import body into rows, returning (rows, line_errors, error).
+    
+    NDJSON lines that aren't valid JSON still get a row (None) so results
+    line up with the input; line_errors maps their row index to the error.
+    """
+    text = body.strip()
+    if not text:
+        return None, None, "Request body must be a JSON array or NDJSON"
+    if text.startswith('['):
+        try:
+            rows = json.loads(text)
+        except ValueError as e:
+            return None, None, f"Invalid JSON array: {str(e)}"
+        return rows, {}, None
+    
+    rows = []
+    line_errors = {}
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            rows.append(json.loads(line))
+        except ValueError as e:
+            line_errors[len(rows)] = f"Line {line_number} is not valid JSON: {str(e)}"
+            rows.append(None)
+    return rows, line_errors, None
+
+def _validate_import_row(row):
+    """Validation errors for one import row (also normalizes it in place)"""
+    if not isinstance(row, dict):
+        return ["Each product must be a JSON object"]
+    if 'model_file' in row:
+        return ["model_file uploads are not supported in bulk imports; upload first and set model_url"]
+    
+    # Set default category if not provided
+    row.setdefault('category', 'default')
+    try:
+        return ProductModel(row).validate()
+    except ArithmeticError:
+        return ["Price must be a number"]
+    except (ValueError, TypeError):
+        return ["Quantity must be an integer"]
+
 def get_all(event, context):
-    """Get all products"""
+    """Get all products, or one page filtered by category and price range"""
     try:
-        products = product_gateway.get_all()
-        return generate_response(200, products)
+        query_params = event.get('queryStringParameters') or {}
+        if any(name in query_params for name in LISTING_PARAMS):
+            return _get_products_page(query_params)
+        
+        # The catalog body and ETag are computed once per cache fill, so an
+        # unchanged catalog is answered with a 304 without re-serializing it
+        catalog = product_gateway.get_catalog()
+        return generate_conditional_response(event, catalog['body'], catalog['etag'], catalog['last_modified'])
     except Exception as e:
         return generate_response(500, {"error": str(e)})
 
+def search(event, context):
+    """Search products by name, category and description, best matches first"""
+    try:
+        query_params = event.get('queryStringParameters') or {}
+        query = (query_params.get('q') or '').strip()
+        if not query:
+            return generate_response(400, {"error": "Search query (q) is required"})
+        
+        limit, error = parse_limit(query_params.get('limit'))
+        if error:
+            return generate_response(400, {"error": error})
+        
+        # Keep the trailing space: it tells the index the last word is complete
+        result = product_gateway.search(query_params['q'], limit)
+        return generate_response(200, {'query': query, 'total': result['total'], 'products': result['products']})
+    except Exception as e:
+        return generate_response(500, {"error": str(e)})
+
+def _get_products_page(query_params):
+    """Response with one page of the filtered product listing"""
+    sort = query_params.get('sort', 'price_asc')
+    if sort not in LISTING_SORTS:
+        return generate_response(400, {"error": f"Invalid sort. Must be one of: {', '.join(LISTING_SORTS)}"})
+    
+    limit, error = parse_limit(query_params.get('limit'))
+    if error:
+        return generate_response(400, {"error": error})
+    
+    prices = {}
+    for name in ('min_price', 'max_price'):
+        if query_params.get(name) is None:
+            prices[name] = None
+            continue
+        try:
+            prices[name] = Decimal(query_params[name])
+        except ArithmeticError:
+            return generate_response(400, {"error": f"{name} must be a number"})
+        if not prices[name].is_finite() or prices[name] < 0:
+            return generate_response(400, {"error": f"{name} must be a non-negative number"})
+    if prices['min_price'] is not None and prices['max_price'] is not None and prices['min_price'] > prices['max_price']:
+        return generate_response(400, {"error": "min_price cannot be greater than max_price"})
+    
+    try:
+        page = product_gateway.list_products_page(
+            limit,
+            query_params.get('cursor'),
+            category=query_params.get('category'),
+            min_price=prices['min_price'],
+            max_price=prices['max_price'],
+            sort=sort
+        )
+    except ValueError as e:
+        return generate_response(400, {"error": str(e)})
+    return generate_response(200, page)
+
 def get_by_id(event, context):
     """Get product by ID or name"""
     try:
@@ -92,7 +244,9 @@ def get_by_id(event, context):
             if not product:
                 return generate_response(404, {"error": f"Product with ID '{identifier}' not found"})
         
-        return generate_response(200, product)
+        body = to_json(product)
+        last_modified = product.get('updated_at') if isinstance(product, dict) else None
+        return generate_conditional_response(event, body, content_etag(body), last_modified)
     except Exception as e:
         return generate_response(500, {"error": str(e)})
 
@@ -179,42 +333,14 @@ def is_admin(user):
     return False
 
 def generate_upload_url(event, context):
-    """Generate a presigned URL for direct S3 upload"""
+    """Generate presigned URLs for direct S3 uploads of one or more files"""
     try:
         # Parse request body
-        body = json.loads(event.get('body', '{}'))
-        file_name = body.get('fileName')
-        file_type = body.get('fileType')
-        
-        if not file_name:
-            return generate_response(400, {"error": "fileName is required"})
-        
-        # Generate a unique file key
-        file_key = f"models/{uuid.uuid4()}-{file_name}"
-        
-        # Create S3 client
-        s3_client = boto3.client('s3')
-        
-        # Generate presigned URL for PUT operation
-        presigned_url = s3_client.generate_presigned_url(
-            'put_object',
-            Params={
-                'Bucket': os.environ['S3_BUCKET_NAME'],
-                'Key': file_key,
-                'ContentType': file_type or 'model/gltf-binary'
-            },
-            ExpiresIn=3600  # URL expires in 1 hour
-        )
-        
-        # Return the presigned URL and file details
-        return generate_response(200, {
-            'uploadUrl': presigned_url,
-            'fileKey': file_key,
-            'modelUrl': f"https://{os.environ['S3_BUCKET_NAME']}.s3.amazonaws.com/{file_key}"
-        })
+        body = json.loads(event.get('body') or '{}')
+        return generate_upload_url_response(upload_gateway, body)
     
     except Exception as e:
         import traceback
         error_details = traceback.format_exc()
         print(f"Error in generate_upload_url: {str(e)}\n{error_details}")
-        return generate_response(500, {"error": str(e)})
\ No newline at end of file
+        return generate_response(500, {"error": str(e)})
@@ -2,7 +2,8 @@ import json
 import os
 from models.user_model import UserModel
 from gateways.user_gateway import UserGateway
-from handlers.utils_handler import generate_response
+from gateways.serializer import to_json_array
+from handlers.utils_handler import generate_response, generate_serialized_response, parse_limit
 import jwt
 
 user_gateway = UserGateway()
@@ -50,16 +51,23 @@ def login(event, context):
         return generate_response(500, {'error': str(e)})
 
 def get_all(event, context):
-    """Get all users - Admin only"""
+    """Get all users, or one page of them with limit/cursor - Admin only"""
     try:
-        
-        # Get all users
-        users = user_gateway.get_all()
-        
-        # Convert to JSON compatible format
-        users_json = [UserModel(user).to_json() for user in users]
-        
-        return generate_response(200, users_json)
+        query_params = event.get('queryStringParameters') or {}
+        if 'limit' in query_params or 'cursor' in query_params:
+            limit, error = parse_limit(query_params.get('limit'))
+            if error:
+                return generate_response(400, {'error': error})
+            try:
+                page = user_gateway.list_users_page(limit, query_params.get('cursor'))
+            except ValueError as e:
+                return generate_response(400, {'error': str(e)})
+            page['users'] = [UserModel(user).to_json() for user in page['users']]
+            return generate_response(200, page)
+        
+        # Serialize users page by page, so the whole table is never held as items
+        pages = ([UserModel(user).to_json() for user in page] for page in user_gateway.iter_pages())
+        return generate_serialized_response(200, to_json_array(pages))
     except Exception as e:
         return generate_response(500, {'error': str(e)})
 
@@ -181,4 +189,4 @@ def _get_user_id_from_token(event):
         return 'admin-user-id'
     except:
         # Return a default admin user ID for testing
-        return 'admin-user-id'
\ No newline at end of file
+        return 'admin-user-id'
@@ -1,23 +1,168 @@
-import json
-from gateways.base_gateway import DecimalEncoder
+import os
+import hashlib
+import jwt
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from gateways.cache import LRUCache, log_cache_stats
+from gateways.serializer import to_json, parse_timestamp
+from gateways.upload_gateway import MAX_UPLOAD_FILES
 
-def generate_response(status_code, body):
+# Verified JWT claims keyed by token digest, kept until the token expires
+token_cache = LRUCache(
+    'jwt',
+    max_size=int(os.environ.get('JWT_CACHE_MAX_ITEMS', '1024')),
+    ttl=float(os.environ.get('JWT_CACHE_TTL_SECONDS', '300'))  # Only for tokens without exp
+)
+
+# Page size bounds for paginated listings
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+def generate_response(status_code, body, headers=None):
     """Generate standardized API response"""
+    return _build_response(status_code, to_json(body), headers)
+
+def parse_limit(raw_limit):
+    """Parse a page size query parameter, returning (limit, error)"""
+    if raw_limit is None:
+        return DEFAULT_PAGE_SIZE, None
+    try:
+        limit = int(raw_limit)
+    except ValueError:
+        return None, "limit must be an integer"
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        return None, f"limit must be between 1 and {MAX_PAGE_SIZE}"
+    return limit, None
+
+def generate_serialized_response(status_code, serialized_body, headers=None):
+    """Generate a standardized API response for an already serialized body"""
+    return _build_response(status_code, serialized_body, headers)
+
+def generate_conditional_response(event, serialized_body, etag, last_modified=None):
+    """Generate a cacheable 200 response for an already serialized body, or a
+    bodiless 304 when the client's validators show it already has this version"""
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "no-cache",
+        "Access-Control-Expose-Headers": "ETag, Last-Modified"
+    }
+    # A stored value that isn't a timestamp leaves the response with the ETag only
+    modified = parse_timestamp(last_modified)
+    if modified:
+        headers["Last-Modified"] = _http_date(modified)
+    
+    if _is_not_modified(event, etag, modified):
+        return _build_response(304, "", headers)
+    return _build_response(200, serialized_body, headers)
+
+def generate_upload_url_response(upload_gateway, body):
+    """Sign upload URLs for a request body holding either a `files` list of
+    {fileName, fileType, size} entries or a single fileName/fileType/size
+    (optionally repeated with isMultiple/fileCount, with a sizes list); sizes
+    are optional and, when given, signed into the URLs"""
+    files = body.get('files')
+    is_multiple = files is not None or bool(body.get('isMultiple', False))
+    if files is None:
+        file_name = body.get('fileName')
+        if not file_name:
+            return generate_response(400, {"error": "fileName is required"})
+        try:
+            file_count = int(body.get('fileCount', 1)) if is_multiple else 1
+        except (TypeError, ValueError):
+            return generate_response(400, {"error": "fileCount must be an integer"})
+        # Checked before the file list is built, so a huge count costs nothing
+        if file_count < 1 or file_count > MAX_UPLOAD_FILES:
+            return generate_response(400, {"error": f"fileCount must be between 1 and {MAX_UPLOAD_FILES}"})
+
+        # Each copy is signed for its own size when a sizes list is given
+        sizes = body.get('sizes')
+        if sizes is not None and (not isinstance(sizes, list) or len(sizes) != file_count):
+            return generate_response(400, {"error": "sizes must be a list with one size per file"})
+        
+        # Use an index suffix to tell several copies of one file name apart
+        stem, extension = os.path.splitext(file_name)
+        files = [{
+            'fileName': f"{stem}_{i}{extension}" if file_count > 1 else file_name,
+            'fileType': body.get('fileType'),
+            'size': sizes[i] if sizes is not None else body.get('size')
+        } for i in range(file_count)]
+
+    result = upload_gateway.generate_upload_urls(files, body.get('expiresIn'))
+    if 'errors' in result:
+        return generate_response(400, {"errors": result['errors']})
+
+    signed = result['files']
+    response = {'files': signed, 'expiresIn': result['expiresIn']}
+    if is_multiple:
+        response.update({
+            'uploadUrls': [entry['uploadUrl'] for entry in signed],
+            'modelUrls': [entry['modelUrl'] for entry in signed],
+            'fileKeys': [entry['fileKey'] for entry in signed]
+        })
+    else:
+        response.update({
+            'uploadUrl': signed[0]['uploadUrl'],
+            'modelUrl': signed[0]['modelUrl'],
+            'fileKey': signed[0]['fileKey']
+        })
+    return generate_response(200, response)
+
+def _build_response(status_code, serialized_body, headers=None):
+    """Assemble the API Gateway response with the standard headers"""
+    response_headers = {
+        "Content-Type": "application/json",
+        "Access-Control-Allow-Origin": "*",
+        "Access-Control-Allow-Credentials": True
+    }
+    if headers:
+        response_headers.update(headers)
+    
+    # Periodically report cache hit ratios from warm containers
+    log_cache_stats()
     return {
         "statusCode": status_code,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Credentials": True
-        },
-        "body": json.dumps(body, cls=DecimalEncoder)
+        "headers": response_headers,
+        "body": serialized_body
     }
 
+def _get_header(event, name):
+    """Look up a request header regardless of its case"""
+    headers = event.get('headers') or {}
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+def _is_not_modified(event, etag, modified):
+    """Check the request's If-None-Match / If-Modified-Since against the current version"""
+    if_none_match = _get_header(event, 'If-None-Match')
+    if if_none_match:
+        # If-None-Match takes precedence; compare weakly as RFC 7232 requires
+        candidates = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in candidates or any(_strip_weak(tag) == etag for tag in candidates)
+    
+    if_modified_since = _get_header(event, 'If-Modified-Since')
+    if if_modified_since and modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+            if since.tzinfo is not None:
+                since = since.astimezone(timezone.utc).replace(tzinfo=None)
+            return modified.replace(microsecond=0) <= since
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def _strip_weak(tag):
+    """Drop the weak validator prefix from an entity tag"""
+    return tag[2:] if tag.startswith('W/') else tag
+
+def _http_date(modified):
+    """Format a naive UTC datetime as an HTTP date"""
+    return format_datetime(modified.replace(tzinfo=timezone.utc), usegmt=True)
+
 def extract_user_from_token(event):
     """Extract and validate user from JWT token in request headers"""
-    import jwt
-    import os
-    
     # Get the token from the authorization header
     # Check both 'Authorization' and 'authorization' due to API Gateway case sensitivity
     headers = event.get('headers', {})
@@ -35,13 +180,21 @@ def extract_user_from_token(event):
     # Extract the token
     token = auth_header.split(' ')[1]
     
+    # Reuse claims already verified in this container (the entry expires with the token)
+    cache_key = hashlib.sha256(token.encode('utf-8')).hexdigest()
+    cached = token_cache.get(cache_key)
+    if cached is not None:
+        return dict(cached)
+    
     try:
         # Decode the token
         decoded = jwt.decode(token, os.environ.get('JWT_SECRET'), algorithms=['HS256'])
-        return decoded
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
         return None
     except Exception:
-        return None
\ No newline at end of file
+        return None
+    
+    token_cache.set(cache_key, decoded, expires_at=decoded.get('exp'))
+    return dict(decoded)
\ No newline at end of file
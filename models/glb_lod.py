@@ -0,0 +1,216 @@
+import json
+import struct
+import numpy as np
+from models.glb_model import (
+    GLB_MAGIC, GLB_HEADER_SIZE, CHUNK_HEADER_SIZE, CHUNK_TYPE_JSON, CHUNK_TYPE_BIN, MODE_TRIANGLES
+)
+
+# Grid resolutions (cells along the longest side) searched for each triangle budget
+MIN_GRID_RESOLUTION = 2
+MAX_GRID_RESOLUTION = 4096
+
+# glTF buffer view targets
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+
+def build_lods(glb_model, ratios, min_triangles=0):
+    """Decimated variants of a parsed GLB, one per triangle budget ratio.
+
+    Returns a list of dicts with ratio, triangle_count, vertex_count and
+    the GLB bytes. Budgets that wouldn't shrink the model (or would go below
+    min_triangles) are skipped.
+    """
+    positions, triangles = scene_triangles(glb_model)
+    if not len(triangles):
+        return []
+
+    material = _base_material(glb_model.gltf)
+    lods = []
+    for ratio in sorted(ratios, reverse=True):
+        target = int(len(triangles) * ratio)
+        if target < max(1, min_triangles):
+            continue
+        lod_positions, lod_triangles = simplify(positions, triangles, target)
+        if not len(lod_triangles) or len(lod_triangles) >= len(triangles):
+            continue
+        # Don't keep a variant identical in size to the previous one
+        if lods and len(lod_triangles) >= lods[-1]['triangle_count']:
+            continue
+        lods.append({
+            'ratio': ratio,
+            'triangle_count': len(lod_triangles),
+            'vertex_count': len(lod_positions),
+            'data': build_glb(lod_positions, lod_triangles, material)
+        })
+    return lods
+
+def scene_triangles(glb_model):
+    """All triangles of the default scene as (positions, triangles) arrays, with
+    node transforms applied so separate meshes keep their placement"""
+    gltf = glb_model.gltf
+    nodes = gltf.get('nodes', [])
+    scenes = gltf.get('scenes', [])
+    if scenes:
+        roots = scenes[gltf.get('scene', 0)].get('nodes', [])
+    else:
+        roots = [index for index, node in enumerate(nodes) if 'mesh' in node]
+
+    position_parts = []
+    triangle_parts = []
+    vertex_offset = 0
+    stack = [(index, np.eye(4)) for index in roots]
+    while stack:
+        node_index, parent_matrix = stack.pop()
+        node = nodes[node_index]
+        matrix = parent_matrix @ _node_matrix(node)
+        stack.extend((child, matrix) for child in node.get('children', []))
+        if 'mesh' not in node:
+            continue
+
+        for primitive in gltf['meshes'][node['mesh']].get('primitives', []):
+            if primitive.get('mode', MODE_TRIANGLES) != MODE_TRIANGLES:
+                continue
+            position = primitive.get('attributes', {}).get('POSITION')
+            if position is None:
+                continue
+            positions = glb_model.accessor_array(position)
+            if positions is None or positions.shape[1] != 3:
+                continue
+
+            if 'indices' in primitive:
+                indices = glb_model.accessor_array(primitive['indices'])
+                if indices is None:
+                    continue
+                indices = indices.reshape(-1)
+            else:
+                indices = np.arange(len(positions))
+            indices = indices[:len(indices) - len(indices) % 3].astype(np.int64)
+
+            world = positions.astype(np.float64) @ matrix[:3, :3].T + matrix[:3, 3]
+            position_parts.append(world)
+            triangle_parts.append(indices.reshape(-1, 3) + vertex_offset)
+            vertex_offset += len(positions)
+
+    if not position_parts:
+        return np.empty((0, 3)), np.empty((0, 3), dtype=np.int64)
+    return np.concatenate(position_parts), np.concatenate(triangle_parts)
+
+def _node_matrix(node):
+    """Local transform of a node as a 4x4 matrix"""
+    if 'matrix' in node:
+        return np.array(node['matrix'], dtype=np.float64).reshape(4, 4).T  # Column-major
+
+    x, y, z, w = node.get('rotation', [0, 0, 0, 1])
+    rotation = np.array([
+        [1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+        [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+        [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)]
+    ])
+    matrix = np.eye(4)
+    matrix[:3, :3] = rotation * np.array(node.get('scale', [1, 1, 1]))
+    matrix[:3, 3] = node.get('translation', [0, 0, 0])
+    return matrix
+
+def simplify(positions, triangles, target_triangles):
+    """Vertex-cluster a mesh down to at most target_triangles, picking the finest
+    grid that fits the budget with a binary search over grid resolutions"""
+    low, high = MIN_GRID_RESOLUTION, MAX_GRID_RESOLUTION
+    best = cluster_vertices(positions, triangles, low)
+    while low <= high:
+        resolution = (low + high) // 2
+        candidate = cluster_vertices(positions, triangles, resolution)
+        if len(candidate[1]) <= target_triangles:
+            best = candidate
+            low = resolution + 1
+        else:
+            high = resolution - 1
+    return best
+
+def cluster_vertices(positions, triangles, resolution):
+    """Merge all vertices in each cell of a uniform grid into their mean, dropping
+    triangles that collapse and faces that become duplicates"""
+    low = positions.min(axis=0)
+    cell_size = (positions.max(axis=0) - low).max() / resolution or 1.0
+    cells = np.minimum(((positions - low) / cell_size).astype(np.int64), resolution - 1)
+    cell_ids = (cells[:, 0] * resolution + cells[:, 1]) * resolution + cells[:, 2]
+    _, cluster = np.unique(cell_ids, return_inverse=True)
+    cluster = cluster.reshape(-1)
+
+    # Representative vertex of each cluster: the mean of its members
+    counts = np.bincount(cluster)
+    merged = np.stack([np.bincount(cluster, weights=positions[:, axis]) for axis in range(3)], axis=1)
+    merged /= counts[:, None]
+
+    faces = cluster[triangles]
+    keep = (faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])
+    faces = faces[keep]
+    if not len(faces):
+        return merged[:0].astype(np.float32), faces.astype(np.uint32)
+
+    # Keep the first of faces sharing the same three vertices
+    ordered = np.sort(faces, axis=1)
+    count = len(counts)
+    if count ** 3 < 2 ** 63:
+        keys = (ordered[:, 0] * count + ordered[:, 1]) * count + ordered[:, 2]
+        _, first = np.unique(keys, return_index=True)
+    else:
+        _, first = np.unique(ordered, axis=0, return_index=True)
+    faces = faces[np.sort(first)]
+
+    # Drop vertices no face uses any more
+    used, remap = np.unique(faces, return_inverse=True)
+    return merged[used].astype(np.float32), remap.reshape(-1, 3).astype(np.uint32)
+
+def build_glb(positions, triangles, material=None):
+    """Write a single-mesh GLB with positions and indices (normals are left to the viewer)"""
+    index_type, component_type = ('<u2', 5123) if len(positions) < 65536 else ('<u4', 5125)
+    index_bytes = triangles.astype(index_type).tobytes()
+    index_bytes += b'\0' * (-len(index_bytes) % 4)
+    position_bytes = positions.astype('<f4').tobytes()
+    binary = index_bytes + position_bytes
+
+    primitive = {'attributes': {'POSITION': 1}, 'indices': 0, 'mode': MODE_TRIANGLES}
+    gltf = {
+        'asset': {'version': '2.0', 'generator': 'anik3d-lod'},
+        'scene': 0,
+        'scenes': [{'nodes': [0]}],
+        'nodes': [{'mesh': 0}],
+        'meshes': [{'primitives': [primitive]}],
+        'buffers': [{'byteLength': len(binary)}],
+        'bufferViews': [
+            {'buffer': 0, 'byteOffset': 0, 'byteLength': triangles.size * np.dtype(index_type).itemsize,
+             'target': ELEMENT_ARRAY_BUFFER},
+            {'buffer': 0, 'byteOffset': len(index_bytes), 'byteLength': len(position_bytes),
+             'target': ARRAY_BUFFER}
+        ],
+        'accessors': [
+            {'bufferView': 0, 'componentType': component_type, 'count': int(triangles.size), 'type': 'SCALAR'},
+            {'bufferView': 1, 'componentType': 5126, 'count': len(positions), 'type': 'VEC3',
+             'min': positions.min(axis=0).tolist(), 'max': positions.max(axis=0).tolist()}
+        ]
+    }
+    if material:
+        gltf['materials'] = [material]
+        primitive['material'] = 0
+
+    json_bytes = json.dumps(gltf, separators=(',', ':')).encode('utf-8')
+    json_bytes += b' ' * (-len(json_bytes) % 4)
+    total = GLB_HEADER_SIZE + CHUNK_HEADER_SIZE * 2 + len(json_bytes) + len(binary)
+    return b''.join([
+        GLB_MAGIC, struct.pack('<II', 2, total),
+        struct.pack('<II', len(json_bytes), CHUNK_TYPE_JSON), json_bytes,
+        struct.pack('<II', len(binary), CHUNK_TYPE_BIN), binary
+    ])
+
+def _base_material(gltf):
+    """Untextured copy of the first material, so variants keep the base colour"""
+    materials = gltf.get('materials', [])
+    if not materials:
+        return None
+    pbr = materials[0].get('pbrMetallicRoughness', {})
+    material = {'pbrMetallicRoughness': {
+        key: pbr[key] for key in ('baseColorFactor', 'metallicFactor', 'roughnessFactor') if key in pbr
+    }}
+    if materials[0].get('doubleSided'):
+        material['doubleSided'] = True
+    return material
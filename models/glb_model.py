@@ -0,0 +1,318 @@
+from models.base_model import BaseModel
+from decimal import Decimal
+import json
+import struct
+
+GLB_MAGIC = b'glTF'
+GLB_HEADER_SIZE = 12
+CHUNK_HEADER_SIZE = 8
+CHUNK_TYPE_JSON = 0x4E4F534A
+CHUNK_TYPE_BIN = 0x004E4942
+
+# glTF accessor componentType -> little-endian NumPy dtype string
+COMPONENT_DTYPES = {
+    5120: '<i1',
+    5121: '<u1',
+    5122: '<i2',
+    5123: '<u2',
+    5125: '<u4',
+    5126: '<f4'
+}
+
+# glTF accessor type -> number of components
+TYPE_SIZES = {'SCALAR': 1, 'VEC2': 2, 'VEC3': 3, 'VEC4': 4, 'MAT2': 4, 'MAT3': 9, 'MAT4': 16}
+
+# Primitive modes
+MODE_TRIANGLES = 4
+MODE_TRIANGLE_STRIP = 5
+MODE_TRIANGLE_FAN = 6
+
+class GlbModel(BaseModel):
+    """Binary glTF (GLB) file parsed in place.
+
+    The data is only ever sliced through a memoryview, so the binary chunk
+    is never copied; accessor data is read through NumPy views over it.
+    NumPy is imported only when accessor data is actually read, which keeps
+    it off the cold-start path of handlers that never need it.
+    `data` may be just the head of the file (header, JSON chunk and the BIN
+    chunk header) when the full size is passed as `total_size`; geometry
+    that needs the binary chunk is then skipped.
+    """
+    def __init__(self, data, total_size=None):
+        self.view = memoryview(data).cast('B')
+        self.total_size = len(self.view) if total_size is None else total_size
+        self.gltf = None
+        self.bin_chunk = None
+        self.bin_length = 0
+        self._errors = self._parse()
+
+    @classmethod
+    def looks_like_glb(cls, data, file_name=None):
+        """Whether a file should be treated as GLB (by extension or magic bytes)"""
+        if file_name and file_name.lower().endswith('.glb'):
+            return True
+        return bytes(memoryview(data)[:4]) == GLB_MAGIC
+
+    @classmethod
+    def head_size(cls, data):
+        """Bytes of the file needed to parse it without the binary chunk, given at
+        least its first 20 bytes (header plus the JSON chunk header)"""
+        if len(data) < GLB_HEADER_SIZE + CHUNK_HEADER_SIZE:
+            return GLB_HEADER_SIZE + CHUNK_HEADER_SIZE
+        json_length = struct.unpack_from('<I', data, GLB_HEADER_SIZE)[0]
+        return GLB_HEADER_SIZE + CHUNK_HEADER_SIZE + json_length + CHUNK_HEADER_SIZE
+
+    def _parse(self):
+        """Read the header and chunks, returning structural errors"""
+        view = self.view
+        if len(view) < GLB_HEADER_SIZE:
+            return ["File is too small to be a GLB model"]
+
+        magic = bytes(view[:4])
+        version, declared_length = struct.unpack_from('<II', view, 4)
+        if magic != GLB_MAGIC:
+            return ["File is not a GLB model (bad magic bytes)"]
+        if version != 2:
+            return [f"Unsupported GLB version {version}; only glTF 2.0 is supported"]
+        if declared_length != self.total_size:
+            return [f"GLB header declares {declared_length} bytes but the file has {self.total_size}"]
+
+        offset = GLB_HEADER_SIZE
+        chunk_index = 0
+        while offset + CHUNK_HEADER_SIZE <= self.total_size and offset + CHUNK_HEADER_SIZE <= len(view):
+            chunk_length, chunk_type = struct.unpack_from('<II', view, offset)
+            start = offset + CHUNK_HEADER_SIZE
+            end = start + chunk_length
+            if end > self.total_size:
+                return [f"GLB chunk {chunk_index} runs past the end of the file"]
+
+            if chunk_index == 0:
+                if chunk_type != CHUNK_TYPE_JSON:
+                    return ["The first GLB chunk must be JSON"]
+                if end > len(view):
+                    return ["GLB JSON chunk is incomplete"]
+                try:
+                    self.gltf = json.loads(bytes(view[start:end]).decode('utf-8'))
+                except (UnicodeDecodeError, ValueError) as e:
+                    return [f"GLB JSON chunk is not valid JSON: {str(e)}"]
+                if not isinstance(self.gltf, dict):
+                    return ["GLB JSON chunk must be an object"]
+            elif chunk_index == 1 and chunk_type == CHUNK_TYPE_BIN:
+                self.bin_length = chunk_length
+                if end <= len(view):
+                    self.bin_chunk = view[start:end]  # A view, not a copy
+
+            offset = end + (-chunk_length % 4)  # Chunks are 4-byte aligned
+            chunk_index += 1
+
+        if self.gltf is None:
+            return ["GLB file has no JSON chunk"]
+        return self._validate_references()
+
+    def _validate_references(self):
+        """Check the types of the fields read later and that meshes, accessors and
+        buffer views point at things that exist, so reading never raises"""
+        gltf = self.gltf
+        if not isinstance(gltf.get('asset'), dict) or 'version' not in gltf['asset']:
+            return ["GLB JSON is missing asset.version"]
+
+        errors = []
+        lists = {}
+        for name in ('buffers', 'bufferViews', 'accessors', 'meshes', 'nodes', 'scenes'):
+            items = gltf.get(name, [])
+            if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+                errors.append(f"{name} must be a list of objects")
+                items = []
+            lists[name] = items
+        if errors:
+            return errors
+        buffers, buffer_views, accessors = lists['buffers'], lists['bufferViews'], lists['accessors']
+
+        for index, buffer_view in enumerate(buffer_views):
+            buffer_index = buffer_view.get('buffer')
+            if not _is_index(buffer_index, len(buffers)):
+                errors.append(f"bufferView {index} references a missing buffer")
+                continue
+            byte_offset = buffer_view.get('byteOffset', 0)
+            byte_length = buffer_view.get('byteLength')
+            stride = buffer_view.get('byteStride')
+            if not _is_count(byte_offset) or not _is_count(byte_length) or not (stride is None or _is_count(stride)):
+                errors.append(f"bufferView {index} has an invalid byteOffset, byteLength or byteStride")
+                continue
+            if buffer_index == 0 and 'uri' not in buffers[0] and byte_offset + byte_length > self.bin_length:
+                errors.append(f"bufferView {index} runs past the end of the binary chunk")
+
+        for index, accessor in enumerate(accessors):
+            if not _is_count(accessor.get('componentType')) or accessor['componentType'] not in COMPONENT_DTYPES:
+                errors.append(f"accessor {index} has an invalid componentType")
+            if not isinstance(accessor.get('type'), str) or accessor['type'] not in TYPE_SIZES:
+                errors.append(f"accessor {index} has an invalid type")
+            if not _is_count(accessor.get('count')):
+                errors.append(f"accessor {index} has an invalid count")
+            if not _is_count(accessor.get('byteOffset', 0)):
+                errors.append(f"accessor {index} has an invalid byteOffset")
+            if 'bufferView' in accessor and not _is_index(accessor['bufferView'], len(buffer_views)):
+                errors.append(f"accessor {index} references a missing bufferView")
+            for bound in ('min', 'max'):
+                values = accessor.get(bound, [])
+                if not isinstance(values, list) or not all(_is_number(value) for value in values):
+                    errors.append(f"accessor {index} has an invalid {bound}")
+
+        for mesh_index, mesh in enumerate(lists['meshes']):
+            primitives = mesh.get('primitives', [])
+            if not isinstance(primitives, list) or not all(isinstance(primitive, dict) for primitive in primitives):
+                errors.append(f"mesh {mesh_index} primitives must be a list of objects")
+                continue
+            for primitive in primitives:
+                attributes = primitive.get('attributes', {})
+                if not isinstance(attributes, dict):
+                    errors.append(f"mesh {mesh_index} attributes must be an object")
+                    continue
+                position = attributes.get('POSITION')
+                if position is not None and not _is_index(position, len(accessors)):
+                    errors.append(f"mesh {mesh_index} POSITION references a missing accessor")
+                indices = primitive.get('indices')
+                if indices is not None and not _is_index(indices, len(accessors)):
+                    errors.append(f"mesh {mesh_index} indices reference a missing accessor")
+                if not _is_count(primitive.get('mode', MODE_TRIANGLES)):
+                    errors.append(f"mesh {mesh_index} has an invalid primitive mode")
+
+        nodes = lists['nodes']
+        for index, node in enumerate(nodes):
+            if 'mesh' in node and not _is_index(node['mesh'], len(lists['meshes'])):
+                errors.append(f"node {index} references a missing mesh")
+            children = node.get('children', [])
+            if not isinstance(children, list) or not all(_is_index(child, len(nodes)) for child in children):
+                errors.append(f"node {index} references a missing child node")
+            for name, size in (('matrix', 16), ('rotation', 4), ('scale', 3), ('translation', 3)):
+                values = node.get(name)
+                if values is not None and (not isinstance(values, list) or len(values) != size
+                                           or not all(_is_number(value) for value in values)):
+                    errors.append(f"node {index} has an invalid {name}")
+        for index, scene in enumerate(lists['scenes']):
+            roots = scene.get('nodes', [])
+            if not isinstance(roots, list) or not all(_is_index(root, len(nodes)) for root in roots):
+                errors.append(f"scene {index} references a missing node")
+        if 'scene' in gltf and not _is_index(gltf['scene'], len(lists['scenes'])):
+            errors.append("scene references a missing scene")
+        return errors
+
+    def validate(self):
+        """Validate the GLB structure"""
+        return list(self._errors)
+
+    def accessor_array(self, accessor_index):
+        """NumPy view (no copy) of an accessor's data in the binary chunk, or None
+        if the data is not available (sparse, external buffer or head-only parse)"""
+        import numpy as np
+        
+        accessor = self.gltf['accessors'][accessor_index]
+        if self.bin_chunk is None or 'bufferView' not in accessor or 'sparse' in accessor:
+            return None
+
+        buffer_view = self.gltf['bufferViews'][accessor['bufferView']]
+        if buffer_view.get('buffer', 0) != 0 or 'uri' in self.gltf['buffers'][0]:
+            return None
+
+        dtype = np.dtype(COMPONENT_DTYPES[accessor['componentType']])
+        components = TYPE_SIZES[accessor['type']]
+        count = accessor['count']
+        offset = buffer_view.get('byteOffset', 0) + accessor.get('byteOffset', 0)
+        stride = buffer_view.get('byteStride') or dtype.itemsize * components
+
+        needed = offset + stride * (count - 1) + dtype.itemsize * components if count else offset
+        if needed > len(self.bin_chunk):
+            return None
+
+        array = np.ndarray(
+            shape=(count, components),
+            dtype=dtype,
+            buffer=self.bin_chunk,
+            offset=offset,
+            strides=(stride, dtype.itemsize)
+        )
+        if accessor.get('normalized') and dtype.kind in 'iu':
+            # Quantized positions (KHR_mesh_quantization) map to [-1, 1] / [0, 1]
+            array = array / float(np.iinfo(dtype).max)
+        return array
+
+    def metadata(self):
+        """Triangle/vertex counts, bounding box and size of the model"""
+        accessors = self.gltf.get('accessors', [])
+        triangle_count = 0
+        vertex_count = 0
+        seen_positions = set()
+        box_min = None
+        box_max = None
+
+        for mesh in self.gltf.get('meshes', []):
+            for primitive in mesh.get('primitives', []):
+                position = primitive.get('attributes', {}).get('POSITION')
+                if position is None:
+                    continue
+
+                position_accessor = accessors[position]
+                if position not in seen_positions:
+                    seen_positions.add(position)
+                    vertex_count += position_accessor['count']
+
+                indices = primitive.get('indices')
+                element_count = accessors[indices]['count'] if indices is not None else position_accessor['count']
+                mode = primitive.get('mode', MODE_TRIANGLES)
+                if mode == MODE_TRIANGLES:
+                    triangle_count += element_count // 3
+                elif mode in (MODE_TRIANGLE_STRIP, MODE_TRIANGLE_FAN):
+                    triangle_count += max(0, element_count - 2)
+
+                low, high = self._position_bounds(position)
+                if low is not None:
+                    box_min = low if box_min is None else [min(a, b) for a, b in zip(box_min, low)]
+                    box_max = high if box_max is None else [max(a, b) for a, b in zip(box_max, high)]
+
+        stats = {
+            'byte_size': self.total_size,
+            'mesh_count': len(self.gltf.get('meshes', [])),
+            'vertex_count': vertex_count,
+            'triangle_count': triangle_count
+        }
+        if box_min is not None:
+            stats['bounding_box'] = {'min': box_min, 'max': box_max}
+        return stats
+
+    def _position_bounds(self, accessor_index):
+        """Min/max of a POSITION accessor, from its declared bounds or its data"""
+        accessor = self.gltf['accessors'][accessor_index]
+        if len(accessor.get('min', [])) == 3 and len(accessor.get('max', [])) == 3:
+            return [float(value) for value in accessor['min']], [float(value) for value in accessor['max']]
+
+        # min/max are required by the spec, but some exporters leave them out
+        positions = self.accessor_array(accessor_index)
+        if positions is None or not len(positions) or positions.shape[1] != 3:
+            return None, None
+        return positions.min(axis=0).tolist(), positions.max(axis=0).tolist()
+
+    def to_dynamodb(self):
+        """Model metadata with numbers converted for DynamoDB"""
+        return _to_decimal(self.metadata())
+
+def _is_index(value, length):
+    """Whether a JSON value is a valid index into a list of the given length"""
+    return isinstance(value, int) and not isinstance(value, bool) and 0 <= value < length
+
+def _is_count(value):
+    """Whether a JSON value is a non-negative integer"""
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+def _is_number(value):
+    """Whether a JSON value is a number"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _to_decimal(value):
+    """Convert floats in nested metadata to Decimal"""
+    if isinstance(value, float):
+        return Decimal(str(round(value, 6)))
+    if isinstance(value, dict):
+        return {key: _to_decimal(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_to_decimal(item) for item in value]
+    return value
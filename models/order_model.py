@@ -4,6 +4,23 @@ from datetime import datetime
 import json
 
 class OrderModel(BaseModel):
+    # Order lifecycle statuses
+    STATUSES = ['pending', 'processing', 'shipped', 'delivered', 'cancelled']
+    
+    # Statuses an order can move to from each status (delivered and cancelled are final)
+    STATUS_TRANSITIONS = {
+        'pending': ['processing', 'shipped', 'cancelled'],
+        'processing': ['shipped', 'cancelled'],
+        'shipped': ['delivered'],
+        'delivered': [],
+        'cancelled': []
+    }
+    
+    @classmethod
+    def prior_statuses(cls, status):
+        """Statuses an order may be in to move to the given status"""
+        return [prior for prior, targets in cls.STATUS_TRANSITIONS.items() if status in targets]
+    
     def __init__(self, order_data=None):
         self.order_data = order_data or {}
         # Generate order_id if not present
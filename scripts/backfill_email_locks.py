@@ -0,0 +1,28 @@
+"""Write email lock items for users registered before email locks existed.
+
+Emails are normalized (trimmed, lowercased) in the same transaction, so
+lookups and the uniqueness check cover legacy users too. Users whose
+normalized email is already taken by another user are reported and left
+as they are. Uses the configured USER_TABLE_NAME.
+
+Usage:
+    python scripts/backfill_email_locks.py [--dry-run]
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gateways.user_gateway import UserGateway
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--dry-run', action='store_true', help='only report what would be written')
+    args = parser.parse_args()
+
+    print(json.dumps(UserGateway().backfill_email_locks(dry_run=args.dry_run)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Benchmark presigned upload URL signing throughput.
+
+Compares the previous handler path (a new S3 client per request, then one
+URL per file) with gateways.upload_gateway.UploadGateway, which signs with
+the shared client. Signing is local, so no AWS access is needed; dummy
+credentials are used when none are configured.
+
+Usage:
+    python scripts/bench_presign.py [--requests N] [--files F]
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-2')
+os.environ.setdefault('S3_BUCKET_NAME', 'bench-bucket')
+
+import boto3
+from gateways.upload_gateway import UploadGateway
+
+def legacy_request(file_count):
+    """The previous order handler: new client, then serial signing"""
+    s3_client = boto3.client('s3')
+    bucket_name = os.environ['S3_BUCKET_NAME']
+    urls = []
+    for i in range(file_count):
+        file_key = f"orders/{uuid.uuid4()}-model_{i}.glb"
+        urls.append(s3_client.generate_presigned_url(
+            'put_object',
+            Params={'Bucket': bucket_name, 'Key': file_key, 'ContentType': 'model/gltf-binary'},
+            ExpiresIn=3600
+        ))
+    return urls
+
+def shared_request(upload_gateway, file_count):
+    """The upload gateway with the warm shared client"""
+    files = [{'fileName': f"model_{i}.glb", 'fileType': 'model/gltf-binary', 'size': 1024} for i in range(file_count)]
+    return upload_gateway.generate_upload_urls(files)['files']
+
+def timed(func, requests):
+    started = time.perf_counter()
+    for _ in range(requests):
+        func()
+    return time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--files', type=int, default=5, help='files per request')
+    args = parser.parse_args()
+
+    upload_gateway = UploadGateway('orders')
+    shared_request(upload_gateway, 1)  # Warm the shared client, as in a warm container
+
+    legacy_time = timed(lambda: legacy_request(args.files), args.requests)
+    shared_time = timed(lambda: shared_request(upload_gateway, args.files), args.requests)
+    urls = args.requests * args.files
+
+    print(f"requests: {args.requests}, files per request: {args.files}")
+    print(f"client per request: {legacy_time / args.requests * 1000:8.2f} ms/request  {urls / legacy_time:9.0f} URLs/s")
+    print(f"shared client:      {shared_time / args.requests * 1000:8.2f} ms/request  {urls / shared_time:9.0f} URLs/s"
+          f"  ({legacy_time / shared_time:.1f}x)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Benchmark the response serializer against the previous order-listing path.
+
+The previous path rebuilt every order dict to strip binary values
+(OrderGateway._sanitize_orders) and then ran json.dumps with
+DecimalEncoder, which calls back into Python for every Decimal.
+gateways.serializer.to_json does the same work in a single pass.
+
+Usage:
+    python scripts/bench_serializer.py [--orders N] [--repeat R] [--binary-every K]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gateways.base_gateway import DecimalEncoder
+from gateways.serializer import to_json
+
+BINARY_TYPES = (bytes, bytearray, memoryview)
+
+def make_orders(count, binary_every):
+    """Synthetic orders shaped like the items in the orders table"""
+    orders = []
+    for index in range(count):
+        order = {
+            'order_id': f"{index:08d}-0000-4000-8000-000000000000",
+            'user_id': '7b0f5c8e-3c1a-4f7e-9a51-2f0d3f3b9d11',
+            'status': 'pending',
+            'created_at': '2026-10-17T08:30:00.000000',
+            'shipping_address': {'street': '12 Rizal St', 'city': 'Manila', 'zip': '1000'},
+            'total_amount': Decimal('1234.56'),
+            'tax_amount': Decimal('96.71'),
+            'include_tax': True,
+            'items': [{
+                'product_id': f"prod-{item}",
+                'quantity': Decimal('2'),
+                'price': Decimal('199.99'),
+                'subtotal': Decimal('399.98'),
+                'price_adjustment': Decimal('0')
+            } for item in range(3)],
+            'custom_models': ['https://bucket.s3.amazonaws.com/orders/model.glb']
+        }
+        if binary_every and index % binary_every == 0:
+            order['thumbnail'] = b'\x89PNG...'
+        orders.append(order)
+    return orders
+
+def legacy_sanitize(orders):
+    """Copy of the removed OrderGateway._sanitize_orders"""
+    sanitized_orders = []
+    for order in orders:
+        sanitized_order = {}
+        for key, value in order.items():
+            if isinstance(value, BINARY_TYPES):
+                continue
+            elif isinstance(value, dict):
+                sanitized_order[key] = {k: v for k, v in value.items() if not isinstance(v, BINARY_TYPES)}
+            elif isinstance(value, list):
+                sanitized_order[key] = []
+                for item in value:
+                    if isinstance(item, dict):
+                        sanitized_order[key].append({k: v for k, v in item.items() if not isinstance(v, BINARY_TYPES)})
+                    elif not isinstance(item, BINARY_TYPES):
+                        sanitized_order[key].append(item)
+            else:
+                sanitized_order[key] = value
+        sanitized_orders.append(sanitized_order)
+    return sanitized_orders
+
+def legacy_path(orders):
+    return json.dumps(legacy_sanitize(orders), cls=DecimalEncoder)
+
+def single_pass(orders):
+    return to_json(orders)
+
+def best_of(func, orders, repeat):
+    """Best wall time over several runs, plus the last output"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output = func(orders)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, output
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--binary-every', type=int, default=0, help='add a binary attribute to every Kth order')
+    args = parser.parse_args()
+
+    orders = make_orders(args.orders, args.binary_every)
+    legacy_time, legacy_output = best_of(legacy_path, orders, args.repeat)
+    new_time, new_output = best_of(single_pass, orders, args.repeat)
+
+    print(f"orders: {args.orders}, payload: {len(new_output) / 1e6:.1f} MB")
+    print(f"sanitize + DecimalEncoder: {legacy_time * 1000:8.1f} ms")
+    print(f"single-pass to_json:       {new_time * 1000:8.1f} ms  ({legacy_time / new_time:.2f}x)")
+    print(f"identical output: {legacy_output == new_output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Measure cold-start cost of every Lambda function in serverless.yml.
+
+Each handler is imported in a fresh interpreter, the way a new Lambda
+container would load it. Two numbers are reported per function:
+  import  - time to import the handler module (module-level gateways included)
+  init    - time to create the AWS clients/tables its gateways use on first call
+
+Usage:
+    python scripts/measure_cold_start.py [--runs N] [--json]
+
+No AWS calls are made; placeholder values are used for any required
+environment variables that are not set.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PLACEHOLDER_ENV = {
+    'AWS_DEFAULT_REGION': 'us-east-2',
+    'AWS_ACCESS_KEY_ID': 'cold-start',
+    'AWS_SECRET_ACCESS_KEY': 'cold-start',
+    'S3_BUCKET_NAME': 'cold-start-bucket',
+    'PRODUCTS_TABLE_NAME': 'products',
+    'USER_TABLE_NAME': 'users',
+    'ORDER_TABLE_NAME': 'orders',
+    'ANALYTICS_TABLE_NAME': 'analytics',
+    'JWT_SECRET': 'cold-start',
+    'ADMIN_ID': 'admin',
+    'ADMIN_PASSWORD': 'admin'
+}
+
+# Runs inside the fresh interpreter and prints the timings as JSON
+PROBE = '''
+import importlib, json, sys, time
+started = time.perf_counter()
+module = importlib.import_module(sys.argv[1])
+imported = time.perf_counter()
+
+from gateways.base_gateway import BaseGateway
+seen = set()
+def touch(gateway):
+    if id(gateway) in seen:
+        return
+    seen.add(id(gateway))
+    gateway.table
+    if hasattr(type(gateway), 's3'):
+        gateway.s3
+    for value in list(vars(gateway).values()):
+        if isinstance(value, BaseGateway):
+            touch(value)
+for value in list(vars(module).values()):
+    if isinstance(value, BaseGateway):
+        touch(value)
+initialized = time.perf_counter()
+
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'init_ms': (initialized - imported) * 1000
+}))
+'''
+
+def load_functions(serverless_path):
+    """Map function name -> handler path from serverless.yml"""
+    functions = {}
+    in_functions = False
+    current = None
+    with open(serverless_path) as f:
+        for line in f:
+            if re.match(r'^functions:\s*$', line):
+                in_functions = True
+                continue
+            if in_functions and re.match(r'^\S', line):
+                break  # Next top-level section
+            if not in_functions:
+                continue
+            name = re.match(r'^  ([A-Za-z0-9_-]+):\s*$', line)
+            if name:
+                current = name.group(1)
+                continue
+            handler = re.match(r'^    handler:\s*(\S+)', line)
+            if handler and current:
+                functions[current] = handler.group(1)
+    return functions
+
+def measure(module_name, runs):
+    """Median import/init time of a module over several fresh interpreters"""
+    env = dict(PLACEHOLDER_ENV)
+    env.update(os.environ)
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE, module_name],
+            cwd=ROOT, env=env, capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+
+    import_ms = statistics.median(sample['import_ms'] for sample in samples)
+    init_ms = statistics.median(sample['init_ms'] for sample in samples)
+    return {'import_ms': round(import_ms, 1), 'init_ms': round(init_ms, 1), 'total_ms': round(import_ms + init_ms, 1)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per function (median is reported)')
+    parser.add_argument('--json', action='store_true', help='print JSON instead of a table')
+    args = parser.parse_args()
+
+    functions = load_functions(os.path.join(ROOT, 'serverless.yml'))
+
+    # Functions sharing a handler module have the same cold start, so measure each module once
+    by_module = {}
+    for handler in functions.values():
+        module_name = handler.rsplit('.', 1)[0].replace('/', '.')
+        if module_name not in by_module:
+            by_module[module_name] = measure(module_name, args.runs)
+
+    results = {}
+    for name, handler in functions.items():
+        module_name = handler.rsplit('.', 1)[0].replace('/', '.')
+        results[name] = dict(by_module[module_name], handler=handler)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'function':<26}{'handler':<48}{'import ms':>10}{'init ms':>10}{'total ms':>10}")
+    for name, result in sorted(results.items(), key=lambda item: -item[1]['total_ms']):
+        print(f"{name:<26}{result['handler']:<48}{result['import_ms']:>10}{result['init_ms']:>10}{result['total_ms']:>10}")
+
+if __name__ == '__main__':
+    main()
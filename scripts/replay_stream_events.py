@@ -0,0 +1,50 @@
+"""Replay recorded orders-table stream events through the analytics consumer.
+
+Accepts a Lambda stream event ({"Records": [...]}), a JSON list of records
+or one record per line (NDJSON). By default only the counter deltas are
+printed; with --apply they are written through AnalyticsGateway using the
+configured ANALYTICS_TABLE_NAME.
+
+Usage:
+    python scripts/replay_stream_events.py events.json [--batch-size N] [--apply]
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gateways.analytics_gateway import stream_deltas
+from gateways.serializer import to_json
+
+def load_records(path):
+    """Stream records from a recorded event file"""
+    with open(path) as handle:
+        text = handle.read()
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    if isinstance(data, dict):
+        return data.get('Records', [])
+    return data
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('path')
+    parser.add_argument('--batch-size', type=int, default=100, help='records per batch, as in the stream trigger')
+    parser.add_argument('--apply', action='store_true', help='write the deltas to the analytics table')
+    args = parser.parse_args()
+
+    records = load_records(args.path)
+    batches = [records[start:start + args.batch_size] for start in range(0, len(records), args.batch_size)]
+    for index, batch in enumerate(batches):
+        print(f"batch {index}: {len(batch)} records")
+        print(to_json(stream_deltas(batch)))
+        if args.apply:
+            from handlers.analytics_handler import process_order_stream
+            print(process_order_stream({'Records': batch}, None))
+
+if __name__ == '__main__':
+    main()